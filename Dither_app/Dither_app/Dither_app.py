@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import sys
+import threading
 import numpy as np
 import colorsys
-from PIL import Image, ImageQt
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer, QPointF
+from PIL import Image
+from PySide6.QtCore import Qt, Signal, Slot, QTimer, QPointF
 from PySide6.QtGui import QPixmap, QImage, QIcon, QCloseEvent, QPainter, QPen, QColor
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
@@ -11,20 +12,35 @@ from PySide6.QtWidgets import (
     QMessageBox, QFrame, QStatusBar, QTabWidget
 )
 
-from algorithms import DitherAlgorithms
+from algorithms import DitherAlgorithms, warm_up_kernels
 from worker import ImageProcessor
 from utils import ImageUtils
+from display import DisplayCache
+from encoding import save_result
+from cache import ResultCache, shared_cache
+import instrumentation
 
 class DitheringApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.original_pil_image = None
+        self.original_digest = None
         self.dithered_pil_image = None
         self.dithered_palette = None
         self.hsv_adjusted_dithered_image = None
         self.final_output_image = None
-        self.processing_thread = None
-        self.worker = None
+        self.processor = ImageProcessor()
+        threading.Thread(target=warm_up_kernels, name="kernel-warm-up", daemon=True).start()
+        self.job_id = None
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(100)
+        self.redither_timer = QTimer(self)
+        self.redither_timer.setSingleShot(True)
+        self.redither_timer.setInterval(250)
+        self.display_cache = DisplayCache()
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(120)
         self.hsv_update_timer = QTimer(self)
         self.hsv_update_timer.setSingleShot(True)
         self.hsv_update_timer.setInterval(150)
@@ -97,9 +113,9 @@ class DitheringApp(QMainWindow):
         dither_widget = QWidget()
         dither_layout = QVBoxLayout(dither_widget)
         self.algorithm_combo = QComboBox()
-        self.algorithm_combo.addItems(["Floyd-Steinberg", "Atkinson", "Jarvis, Judice, Ninke", "Stucki", "Bayer (Ordered)", "Clustered Dot Halftone", "Random"])
+        self.algorithm_combo.addItems(list(DitherAlgorithms.ALGORITHMS))
         self.palette_combo = QComboBox()
-        palette_options = ["Auto (From Image)", "Grayscale"] + list(DitherAlgorithms.PREDEFINED_PALETTES.keys())
+        palette_options = DitherAlgorithms.DYNAMIC_PALETTES + list(DitherAlgorithms.PREDEFINED_PALETTES.keys())
         self.palette_combo.addItems(palette_options)
         self.color_slider = QSlider(Qt.Horizontal)
         self.color_slider.setMinimum(2)
@@ -113,6 +129,12 @@ class DitheringApp(QMainWindow):
         self.strength_slider.setValue(100)
         self.strength_slider_label = QLabel(f"{self.strength_slider.value()}%")
         self.strength_slider_label.setAlignment(Qt.AlignCenter)
+        self.block_slider = QSlider(Qt.Horizontal)
+        self.block_slider.setMinimum(1)
+        self.block_slider.setMaximum(16)
+        self.block_slider.setValue(1)
+        self.block_slider_label = QLabel("Off")
+        self.block_slider_label.setAlignment(Qt.AlignCenter)
         self.dither_button = QPushButton("Apply Dithering")
         dither_layout.addWidget(QLabel("Dithering Algorithm:"))
         dither_layout.addWidget(self.algorithm_combo)
@@ -124,6 +146,9 @@ class DitheringApp(QMainWindow):
         dither_layout.addWidget(QLabel("Dithering Strength:"))
         dither_layout.addWidget(self.strength_slider_label)
         dither_layout.addWidget(self.strength_slider)
+        dither_layout.addWidget(QLabel("Pixel Size (block-averaged, dithered small, enlarged):"))
+        dither_layout.addWidget(self.block_slider_label)
+        dither_layout.addWidget(self.block_slider)
         dither_layout.addStretch()
         dither_layout.addWidget(self.dither_button)
         adjust_widget = QWidget()
@@ -176,8 +201,21 @@ class DitheringApp(QMainWindow):
         self.apply_lut_button.clicked.connect(self.apply_lut)
         self.reset_hsv_button.clicked.connect(self.reset_hsv)
         self.hsv_update_timer.timeout.connect(self._apply_hsv_adjustments_to_dithered)
+        self.redither_timer.timeout.connect(self.start_dithering)
+        self.progress_timer.timeout.connect(self._report_progress)
+        self.resize_timer.timeout.connect(self._refresh_displays)
+        self.processor.preview.connect(self.on_dithering_preview)
+        self.processor.finished.connect(self.on_dithering_complete)
+        self.processor.error.connect(self.on_dithering_error)
+        self.processor.cancelled.connect(self.on_dithering_cancelled)
+        self.algorithm_combo.currentTextChanged.connect(self._on_dither_params_changed)
+        self.palette_combo.currentTextChanged.connect(self._on_dither_params_changed)
+        self.color_slider.valueChanged.connect(self._on_dither_params_changed)
+        self.strength_slider.valueChanged.connect(self._on_strength_changed)
         self.color_slider.valueChanged.connect(lambda v: self.color_slider_label.setText(f"{v} Colors"))
         self.strength_slider.valueChanged.connect(lambda v: self.strength_slider_label.setText(f"{v}%"))
+        self.block_slider.valueChanged.connect(self._on_dither_params_changed)
+        self.block_slider.valueChanged.connect(lambda v: self.block_slider_label.setText(f"{v}x{v} px" if v > 1 else "Off"))
         self.palette_combo.currentTextChanged.connect(self.on_palette_change)
         self.hue_slider.valueChanged.connect(self._schedule_hsv_update)
         self.sat_slider.valueChanged.connect(self._schedule_hsv_update)
@@ -204,12 +242,18 @@ class DitheringApp(QMainWindow):
             v = max(0.0, min(1.0, v + v_shift))
             r_new, g_new, b_new = colorsys.hsv_to_rgb(h, s, v)
             new_palette.append([int(r_new*255), int(g_new*255), int(b_new*255)])
-        img_array = np.array(self.dithered_pil_image)
-        output_array = img_array.copy()
-        for i, original_color in enumerate(self.dithered_palette):
-            mask = np.all(img_array == original_color, axis=-1)
-            output_array[mask] = new_palette[i]
-        self.hsv_adjusted_dithered_image = Image.fromarray(output_array)
+        if self.dithered_pil_image.mode == "P":
+            self.hsv_adjusted_dithered_image = self.dithered_pil_image.copy()
+            self.hsv_adjusted_dithered_image.putpalette(bytes(np.clip(new_palette, 0, 255).astype(np.uint8)))
+            # Same index plane, new color table: the display keeps wrapping the original buffer.
+            self.hsv_adjusted_dithered_image.source_array = getattr(self.dithered_pil_image, 'source_array', None)
+        else:
+            img_array = np.array(self.dithered_pil_image)
+            output_array = img_array.copy()
+            for i, original_color in enumerate(self.dithered_palette):
+                mask = np.all(img_array == original_color, axis=-1)
+                output_array[mask] = new_palette[i]
+            self.hsv_adjusted_dithered_image = DitherAlgorithms.rgb_image(output_array)
         self.final_output_image = self.hsv_adjusted_dithered_image
         self.display_image(self.final_output_image, is_preview=False)
         self.lut_combo.setCurrentIndex(0)
@@ -236,28 +280,52 @@ class DitheringApp(QMainWindow):
         self.display_image(self.final_output_image, is_preview=False)
         self.status_bar.showMessage(f"Applied '{lut_name}' color grade.")
 
+    def _on_dither_params_changed(self, *args):
+        if self.job_id is not None:
+            self.redither_timer.start()
+
+    def _on_strength_changed(self, *args):
+        # Error-diffusion strength only re-blends the index planes the worker kept from the last run, so it renders
+        # live while the slider moves; anything that needs a new diffusion pass waits for the debounce timer.
+        if self.dithered_pil_image is not None and self.processor.can_blend("result", self._dither_params()):
+            self.start_dithering()
+        else:
+            self._on_dither_params_changed()
+
+    def _dither_params(self):
+        preview_size = (self.dithered_image_label.width(), self.dithered_image_label.height())
+        return {'algorithm_name': self.algorithm_combo.currentText(),'palette_name': self.palette_combo.currentText(),'num_colors': self.color_slider.value(),'dither_strength': self.strength_slider.value(),'block_size': self.block_slider.value(),'image_digest': self.original_digest,'preview_size': preview_size}
+
+    def _report_progress(self):
+        progress = self.processor.progress("result")
+        if progress is not None:
+            self.status_bar.showMessage(f"Processing... {progress:.0%}")
+
     def start_dithering(self):
         if not self.original_pil_image:
             return
+        self.redither_timer.stop()
         self._update_ui_state(is_processing=True)
-        dither_params = {'algorithm_name': self.algorithm_combo.currentText(),'palette_name': self.palette_combo.currentText(),'num_colors': self.color_slider.value(),'dither_strength': self.strength_slider.value()}
-        self.processing_thread = QThread()
-        self.worker = ImageProcessor(self.original_pil_image, dither_params)
-        self.worker.moveToThread(self.processing_thread)
-        self.processing_thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.on_dithering_complete)
-        self.worker.error.connect(self.on_dithering_error)
-        self.worker.finished.connect(self.processing_thread.quit)
-        self.processing_thread.finished.connect(self._on_thread_finished)
-        self.processing_thread.start()
+        self.job_id = self.processor.submit("result", self.original_pil_image, self._dither_params())
+        self.progress_timer.start()
 
     def display_image(self, pil_img, is_preview):
         target_label = self.original_image_label if is_preview else self.dithered_image_label
-        q_image = ImageQt.ImageQt(pil_img)
-        pixmap = QPixmap.fromImage(q_image)
-        target_label.setPixmap(pixmap.scaled(target_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        with instrumentation.span("display", mode=pil_img.mode, width=pil_img.width, height=pil_img.height):
+            pixmap = self.display_cache.pixmap("original" if is_preview else "result", pil_img, target_label.width(), target_label.height())
+            target_label.setPixmap(pixmap)
+
+    def on_dithering_preview(self, view, job_id, preview_image):
+        if job_id != self.job_id:
+            return
+        self.display_image(preview_image, is_preview=False)
+        self.status_bar.showMessage("Preview ready. Rendering full resolution...")
 
-    def on_dithering_complete(self, processed_image, used_palette):
+    def on_dithering_complete(self, view, job_id, processed_image, used_palette):
+        if job_id != self.job_id:
+            return
+        self.job_id = None
+        self.progress_timer.stop()
         self.dithered_pil_image = processed_image
         self.dithered_palette = used_palette
         self.hsv_adjusted_dithered_image = None
@@ -267,7 +335,12 @@ class DitheringApp(QMainWindow):
         self.display_image(self.final_output_image, is_preview=False)
         self._update_ui_state()
         self.tabs.setCurrentIndex(0)
-        self.status_bar.showMessage("Dithering complete. Post-processing enabled.")
+        stats = shared_cache().stats()
+        message = f"Dithering complete. Post-processing enabled. (Cache: {stats['hits']} hits / {stats['misses']} misses)"
+        job_trace = self.processor.last_trace(view)
+        if job_trace:
+            message += f" | {job_trace.summary()}"
+        self.status_bar.showMessage(message)
 
     def open_image(self, *args):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open Image", "", "Image Files (*.png *.jpg *.jpeg *.bmp)")
@@ -275,7 +348,11 @@ class DitheringApp(QMainWindow):
             return
         try:
             self.status_bar.showMessage(f"Loading: {file_path}...")
-            self.original_pil_image = Image.open(file_path).convert('RGB')
+            with instrumentation.span("open", path=file_path):
+                with instrumentation.span("decode"):
+                    self.original_pil_image = Image.open(file_path).convert('RGB')
+                with instrumentation.span("digest"):
+                    self.original_digest = ResultCache.image_digest(self.original_pil_image)
             self.dithered_pil_image = None
             self.dithered_palette = None
             self.final_output_image = None
@@ -291,7 +368,7 @@ class DitheringApp(QMainWindow):
     def _update_ui_state(self, is_processing=False):
         has_original = self.original_pil_image is not None
         has_dithered = self.dithered_pil_image is not None
-        self.tabs.setTabEnabled(0, has_original and not is_processing)
+        self.tabs.setTabEnabled(0, has_original)
         self.tabs.setTabEnabled(1, has_dithered and not is_processing)
         self.tabs.setTabEnabled(2, has_dithered and not is_processing)
         self.open_button.setEnabled(not is_processing)
@@ -304,23 +381,36 @@ class DitheringApp(QMainWindow):
             self.status_bar.showMessage("Image loaded. Ready to dither.")
 
     def resizeEvent(self, event):
+        self.resize_timer.start()
+        super().resizeEvent(event)
+
+    def _refresh_displays(self):
         if self.original_pil_image:
             self.display_image(self.original_pil_image, is_preview=True)
         if self.final_output_image:
             self.display_image(self.final_output_image, is_preview=False)
-        super().resizeEvent(event)
 
-    def on_dithering_error(self, traceback_str):
+    def on_dithering_error(self, view, job_id, traceback_str):
+        if job_id != self.job_id:
+            return
         print("--- PROCESSING ERROR ---")
         print(traceback_str)
         print("------------------------")
-        if self.processing_thread and self.processing_thread.isRunning():
-            self.processing_thread.quit()
+        self.job_id = None
+        self.progress_timer.stop()
         self._update_ui_state()
         self.status_bar.showMessage("An error occurred. See console for details.")
 
+    def on_dithering_cancelled(self, view, job_id):
+        if job_id != self.job_id:
+            return
+        self.job_id = None
+        self.progress_timer.stop()
+        self._update_ui_state()
+        self.status_bar.showMessage("Dithering cancelled.")
+
     def on_palette_change(self, text):
-        is_dynamic_palette = text in ["Auto (From Image)", "Grayscale"]
+        is_dynamic_palette = text in DitherAlgorithms.DYNAMIC_PALETTES
         self.color_slider.setEnabled(is_dynamic_palette)
         self.color_slider_label.setEnabled(is_dynamic_palette)
 
@@ -328,25 +418,16 @@ class DitheringApp(QMainWindow):
         image_to_save = self.final_output_image if self.final_output_image else self.dithered_pil_image
         if not image_to_save:
             return
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Final Image", "", "PNG Image (*.png);;JPEG Image (*.jpg)")
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "Save Final Image", "", "PNG Image (*.png);;JPEG Image (*.jpg);;Packed Indices (*.bin);;Packed Bitplanes (*.bin)")
         if file_path:
             try:
-                image_to_save.save(file_path)
+                save_result(image_to_save, file_path, "planar" if "Bitplanes" in selected_filter else "packed")
                 self.status_bar.showMessage(f"Image successfully saved to {file_path}")
             except Exception as e:
                 QMessageBox.critical(self, "Save Error", f"Failed to save image:\n{e}")
 
-    def _on_thread_finished(self):
-        if self.worker:
-            self.worker.deleteLater()
-        if self.processing_thread:
-            self.processing_thread.deleteLater()
-        self.worker, self.processing_thread = None, None
-
     def closeEvent(self, event: QCloseEvent):
-        if self.processing_thread and self.processing_thread.isRunning():
-            self.processing_thread.quit()
-            self.processing_thread.wait(3000)
+        self.processor.shutdown()
         event.accept()
 
 if __name__ == "__main__":
@@ -1,59 +1,95 @@
+import contextlib
+import threading
+import time
 import numpy as np
 import numba
 from PIL import Image
+import instrumentation
+from palette import DEFAULT_PALETTE_METHOD, PARALLEL_KERNEL_LOCK, cached_palette, extract_palette
+import bluenoise
 
-@numba.jit(nopython=True)
-def _jit_find_closest_palette_color(pixel, palette):
-    min_dist_sq = np.inf; best_color = palette[0]
-    for color in palette:
-        dist_sq = np.sum((pixel - color)**2)
-        if dist_sq < min_dist_sq:
-            min_dist_sq = dist_sq; best_color = color
-    return best_color
+PALETTE_INDEX_BITS = 5
 
-@numba.jit(nopython=True)
-def _jit_apply_quantization(img_array, palette):
-    height, width, _ = img_array.shape; quantized_array = np.zeros_like(img_array)
-    for y in range(height):
-        for x in range(width):
-            quantized_array[y, x] = _jit_find_closest_palette_color(img_array[y, x], palette)
-    return quantized_array
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_build_palette_index(palette):
+    # Quantized RGB cube: each cell keeps every palette entry that can be nearest to some point inside it.
+    cells = 1 << PALETTE_INDEX_BITS; step = 256.0 / cells; n_colors = palette.shape[0]
+    offsets = np.zeros(cells**3 + 1, dtype=np.int32); candidates = np.empty(cells**3 * n_colors, dtype=np.int32)
+    min_d = np.empty(n_colors); count = 0
+    for r in range(cells):
+        for g in range(cells):
+            for b in range(cells):
+                lo = np.array((r * step, g * step, b * step)); best_max = np.inf
+                for i in range(n_colors):
+                    d_min = 0.0; d_max = 0.0
+                    for c in range(3):
+                        p = palette[i, c]; near = min(max(p, lo[c]), lo[c] + step)
+                        far = max(abs(p - lo[c]), abs(p - lo[c] - step))
+                        d_min += (p - near)**2; d_max += far**2
+                    min_d[i] = d_min
+                    if d_max < best_max: best_max = d_max
+                for i in range(n_colors):
+                    if min_d[i] <= best_max * (1.0 + 1e-9) + 1e-9:
+                        candidates[count] = i; count += 1
+                offsets[(r * cells + g) * cells + b + 1] = count
+    return offsets, candidates[:count].copy()
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_find_closest_palette_index(pixel, palette, offsets, candidates):
+    cells = 1 << PALETTE_INDEX_BITS; scale = cells / 256.0
+    r = pixel[0] * scale; g = pixel[1] * scale; b = pixel[2] * scale
+    if 0.0 <= r < cells and 0.0 <= g < cells and 0.0 <= b < cells:
+        cell = (int(r) * cells + int(g)) * cells + int(b); start = offsets[cell]; stop = offsets[cell + 1]
+    else:
+        start = 0; stop = -1
+    min_dist_sq = np.inf; best_index = 0
+    for k in range(start, stop if stop >= 0 else palette.shape[0]):
+        i = candidates[k] if stop >= 0 else k
+        dist_sq = (pixel[0] - palette[i, 0])**2 + (pixel[1] - palette[i, 1])**2 + (pixel[2] - palette[i, 2])**2
+        if dist_sq < min_dist_sq:
+            min_dist_sq = dist_sq; best_index = i
+    return best_index
 
-@numba.jit(nopython=True)
-def _jit_apply_floyd_steinberg(img_array, palette):
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_floyd_steinberg(img_array, palette, offsets, candidates, index_array, control):
     height, width, _ = img_array.shape
     for y in range(height):
+        if control[0] != 0: break
         for x in range(width):
-            old_pixel = img_array[y, x].copy(); new_pixel = _jit_find_closest_palette_color(old_pixel, palette)
-            img_array[y, x] = new_pixel; quant_error = old_pixel - new_pixel
+            old_pixel = img_array[y, x].copy(); index = _jit_find_closest_palette_index(old_pixel, palette, offsets, candidates)
+            new_pixel = palette[index]; index_array[y, x] = index; quant_error = old_pixel - new_pixel
             if x + 1 < width: img_array[y, x + 1] += quant_error * 7.0 / 16.0
             if x - 1 >= 0 and y + 1 < height: img_array[y + 1, x - 1] += quant_error * 3.0 / 16.0
             if y + 1 < height: img_array[y + 1, x] += quant_error * 5.0 / 16.0
             if x + 1 < width and y + 1 < height: img_array[y + 1, x + 1] += quant_error * 1.0 / 16.0
-    return img_array
+        control[1] += 1
+    return index_array
 
-@numba.jit(nopython=True)
-def _jit_apply_atkinson(img_array, palette):
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_atkinson(img_array, palette, offsets, candidates, index_array, control):
     height, width, _ = img_array.shape
     for y in range(height):
+        if control[0] != 0: break
         for x in range(width):
-            old_pixel = img_array[y, x].copy(); new_pixel = _jit_find_closest_palette_color(old_pixel, palette)
-            img_array[y, x] = new_pixel; quant_error = old_pixel - new_pixel; error_share = quant_error / 8.0
+            old_pixel = img_array[y, x].copy(); index = _jit_find_closest_palette_index(old_pixel, palette, offsets, candidates)
+            new_pixel = palette[index]; index_array[y, x] = index; quant_error = old_pixel - new_pixel; error_share = quant_error / 8.0
             if x + 1 < width: img_array[y, x + 1] += error_share
             if x + 2 < width: img_array[y, x + 2] += error_share
             if x - 1 >= 0 and y + 1 < height: img_array[y + 1, x - 1] += error_share
             if y + 1 < height: img_array[y + 1, x] += error_share
             if x + 1 < width and y + 1 < height: img_array[y + 1, x + 1] += error_share
             if y + 2 < height: img_array[y + 2, x] += error_share
-    return img_array
+        control[1] += 1
+    return index_array
 
-@numba.jit(nopython=True)
-def _jit_apply_jnn(img_array, palette):
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_jnn(img_array, palette, offsets, candidates, index_array, control):
     height, width, _ = img_array.shape
     for y in range(height):
+        if control[0] != 0: break
         for x in range(width):
-            old_pixel = img_array[y, x].copy(); new_pixel = _jit_find_closest_palette_color(old_pixel, palette)
-            img_array[y, x] = new_pixel; quant_error = old_pixel - new_pixel
+            old_pixel = img_array[y, x].copy(); index = _jit_find_closest_palette_index(old_pixel, palette, offsets, candidates)
+            new_pixel = palette[index]; index_array[y, x] = index; quant_error = old_pixel - new_pixel
             if x + 1 < width: img_array[y, x + 1] += quant_error * 7.0 / 48.0
             if x + 2 < width: img_array[y, x + 2] += quant_error * 5.0 / 48.0
             if y + 1 < height:
@@ -68,15 +104,17 @@ def _jit_apply_jnn(img_array, palette):
                 img_array[y + 2, x] += quant_error * 5.0 / 48.0
                 if x + 1 < width: img_array[y + 2, x + 1] += quant_error * 3.0 / 48.0
                 if x + 2 < width: img_array[y + 2, x + 2] += quant_error * 1.0 / 48.0
-    return img_array
+        control[1] += 1
+    return index_array
 
-@numba.jit(nopython=True)
-def _jit_apply_stucki(img_array, palette):
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_stucki(img_array, palette, offsets, candidates, index_array, control):
     height, width, _ = img_array.shape
     for y in range(height):
+        if control[0] != 0: break
         for x in range(width):
-            old_pixel = img_array[y, x].copy(); new_pixel = _jit_find_closest_palette_color(old_pixel, palette)
-            img_array[y, x] = new_pixel; quant_error = old_pixel - new_pixel
+            old_pixel = img_array[y, x].copy(); index = _jit_find_closest_palette_index(old_pixel, palette, offsets, candidates)
+            new_pixel = palette[index]; index_array[y, x] = index; quant_error = old_pixel - new_pixel
             if x + 1 < width: img_array[y, x + 1] += quant_error * 8.0 / 42.0
             if x + 2 < width: img_array[y, x + 2] += quant_error * 4.0 / 42.0
             if y + 1 < height:
@@ -91,15 +129,192 @@ def _jit_apply_stucki(img_array, palette):
                 img_array[y + 2, x] += quant_error * 4.0 / 42.0
                 if x + 1 < width: img_array[y + 2, x + 1] += quant_error * 2.0 / 42.0
                 if x + 2 < width: img_array[y + 2, x + 2] += quant_error * 1.0 / 42.0
-    return img_array
+        control[1] += 1
+    return index_array
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_threshold_row(img_array, threshold, y, ty, palette, offsets, candidates, out_array):
+    width = img_array.shape[1]; t_width, t_channels = threshold.shape[1], threshold.shape[2]; pixel = np.empty(3)
+    for x in range(width):
+        tx = x % t_width
+        for c in range(3): pixel[c] = img_array[y, x, c] + threshold[ty, tx, c % t_channels]
+        out_array[y, x] = _jit_find_closest_palette_index(pixel, palette, offsets, candidates)
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_threshold_palette(img_array, threshold, y_offset, palette, offsets, candidates, out_array, control):
+    for y in range(img_array.shape[0]):
+        if control[0] != 0: break
+        _jit_threshold_row(img_array, threshold, y, (y + y_offset) % threshold.shape[0], palette, offsets, candidates, out_array)
+        control[1] += 1
+    return out_array
+
+@numba.jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _jit_apply_threshold_palette_parallel(img_array, threshold, y_offset, palette, offsets, candidates, out_array, control):
+    # Adds a tiled per-pixel threshold and snaps to the palette; rows carry no dependencies so they run under prange.
+    # Progress is counted per band of rows on the serial outer loop, since prange threads cannot share a counter.
+    height = img_array.shape[0]
+    for band in range(0, height, PARALLEL_PROGRESS_ROWS):
+        if control[0] != 0: break
+        band_stop = min(height, band + PARALLEL_PROGRESS_ROWS)
+        for y in numba.prange(band, band_stop):
+            _jit_threshold_row(img_array, threshold, y, (y + y_offset) % threshold.shape[0], palette, offsets, candidates, out_array)
+        control[1] += band_stop - band
+    return out_array
 
-@numba.jit(nopython=True)
-def _jit_apply_bayer_palette(img_array, palette):
-    height, width, _ = img_array.shape; dithered_array = np.zeros_like(img_array)
+THRESHOLD_BAND_ROWS = 256
+
+# Error diffusion footprints as (dy, dx, weight) rows over a common divisor, listed in source raster order as seen from
+# the receiving pixel so that gathering them reproduces the serial kernels' accumulation order exactly.
+FLOYD_STEINBERG_TAPS = (np.array([[1, 1, 1], [1, 0, 5], [1, -1, 3], [0, 1, 7]], dtype=np.int64), 16.0)
+ATKINSON_TAPS = (np.array([[2, 0, 1], [1, 1, 1], [1, 0, 1], [1, -1, 1], [0, 2, 1], [0, 1, 1]], dtype=np.int64), 8.0)
+JNN_TAPS = (np.array([[2, 2, 1], [2, 1, 3], [2, 0, 5], [2, -1, 3], [2, -2, 1], [1, 2, 3], [1, 1, 5], [1, 0, 7], [1, -1, 5], [1, -2, 3], [0, 2, 5], [0, 1, 7]], dtype=np.int64), 48.0)
+STUCKI_TAPS = (np.array([[2, 2, 1], [2, 1, 2], [2, 0, 4], [2, -1, 2], [2, -2, 1], [1, 2, 2], [1, 1, 4], [1, 0, 8], [1, -1, 4], [1, -2, 2], [0, 2, 4], [0, 1, 8]], dtype=np.int64), 42.0)
+WAVEFRONT_BLOCK = 64
+PARALLEL_PROGRESS_ROWS = 64
+PARALLEL_MIN_PIXELS = 2_000_000
+PRECISIONS = ("float64", "float32", "fixed")
+FIXED_POINT_SHIFT = 4
+# Carried error outgrows 16 bits when the palette cannot reach part of the image's gamut (e.g. Game Boy greens on blue
+# sky), so the fixed-point ring is int32 (only three rows, so the width costs nothing), saturating at half its range so
+# that adding a pixel to the carried error still fits the kernel's int32 arithmetic.
+FIXED_ERROR_DTYPE = np.int32
+FIXED_ERROR_LIMIT = np.iinfo(FIXED_ERROR_DTYPE).max >> 1
+DIFFUSION_TAPS = {"floyd_steinberg": FLOYD_STEINBERG_TAPS, "atkinson": ATKINSON_TAPS, "jnn": JNN_TAPS, "stucki": STUCKI_TAPS}
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_diffuse_block(img_array, error, palette, offsets, candidates, taps, divisor, index_array, y, x_start, x_stop):
+    width = img_array.shape[1]; pixel = np.empty(3, dtype=img_array.dtype)
+    for x in range(x_start, x_stop):
+        for c in range(3):
+            value = img_array[y, x, c]
+            for t in range(taps.shape[0]):
+                sy = y - taps[t, 0]; sx = x - taps[t, 1]
+                if sy >= 0 and 0 <= sx < width: value += error[sy, sx, c] * taps[t, 2] / divisor
+            pixel[c] = value
+        index = _jit_find_closest_palette_index(pixel, palette, offsets, candidates); index_array[y, x] = index
+        for c in range(3): error[y, x, c] = pixel[c] - palette[index, c]
+
+@numba.jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _jit_apply_diffusion_wavefront(img_array, palette, offsets, candidates, taps, divisor, index_array, control):
+    # Skewed wavefront over column blocks: block b of row y runs at step b + 2y, once row y-1 has finished block b+1.
+    height, width, _ = img_array.shape; error = np.zeros_like(img_array)
+    n_blocks = (width + WAVEFRONT_BLOCK - 1) // WAVEFRONT_BLOCK; rows_before = control[1]
+    for step in range(n_blocks + 2 * (height - 1)):
+        if control[0] != 0: break
+        y_first = max(0, (step - n_blocks + 2) // 2); y_last = min(height - 1, step // 2)
+        for y in numba.prange(y_first, y_last + 1):
+            x_start = (step - 2 * y) * WAVEFRONT_BLOCK
+            _jit_diffuse_block(img_array, error, palette, offsets, candidates, taps, divisor, index_array, y, x_start, min(width, x_start + WAVEFRONT_BLOCK))
+        if step >= n_blocks - 1: control[1] = rows_before + (step - n_blocks + 1) // 2 + 1
+    return index_array
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_diffusion_fixed(img_array, palette, offsets, candidates, taps, divisor, error_rows, y_offset, index_array, palette_rgb, control):
+    # Fixed-point error diffusion over uint8 input; error lives in a ring of integer rows indexed by the absolute row
+    # (y_offset + y) % len(error_rows), so callers can feed consecutive row bands and keep the ring between calls.
+    height, width, _ = img_array.shape; n_rows = error_rows.shape[0]; one = 1 << FIXED_POINT_SHIFT
+    div = int(divisor); half = div // 2; pixel = np.empty(3); value = np.empty(3, dtype=np.int32)
     for y in range(height):
+        if control[0] != 0: break
+        row = error_rows[(y_offset + y) % n_rows]
         for x in range(width):
-            dithered_array[y,x] = _jit_find_closest_palette_color(img_array[y,x], palette)
-    return dithered_array
+            for c in range(3):
+                value[c] = (np.int32(img_array[y, x, c]) << FIXED_POINT_SHIFT) + row[x, c]; pixel[c] = value[c] / one
+            index = _jit_find_closest_palette_index(pixel, palette, offsets, candidates); index_array[y, x] = index
+            for c in range(3):
+                error = value[c] - (np.int32(palette_rgb[index, c]) << FIXED_POINT_SHIFT)
+                for t in range(taps.shape[0]):
+                    tx = x + taps[t, 1]
+                    if 0 <= tx < width:
+                        q = error * taps[t, 2]; share = (q + half) // div if q >= 0 else -((half - q) // div)
+                        target = error_rows[(y_offset + y + taps[t, 0]) % n_rows]
+                        target[tx, c] = min(FIXED_ERROR_LIMIT, max(-FIXED_ERROR_LIMIT, target[tx, c] + share))
+        row[:] = 0; control[1] += 1
+    return index_array
+
+GRAY_LEVEL_WINDOW = 3
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_nearest_level(value, levels, first, step):
+    # O(1) quantizer for ascending levels that sit within one step of first + i * step: round onto that grid, then settle
+    # among the neighbours the levels' own rounding can have displaced. Ties go to the lower index, as in the palette search.
+    n = levels.shape[0]; guess = min(n - 1, max(0, int(np.floor((value - first) / step + 0.5))))
+    best = np.inf; best_index = 0
+    for i in range(max(0, guess - GRAY_LEVEL_WINDOW), min(n, guess + GRAY_LEVEL_WINDOW + 1)):
+        d = abs(value - levels[i])
+        if d < best: best = d; best_index = i
+    return best_index
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_threshold_gray_row(img_array, threshold, y, ty, levels, first, step, out_array):
+    width = img_array.shape[1]; t_width, t_channels = threshold.shape[1], threshold.shape[2]
+    for x in range(width):
+        tx = x % t_width; value = 0.0
+        for c in range(3): value += img_array[y, x, c] + threshold[ty, tx, c % t_channels]
+        out_array[y, x] = _jit_nearest_level(value / 3.0, levels, first, step)
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_threshold_gray(img_array, threshold, y_offset, levels, first, step, out_array, control):
+    for y in range(img_array.shape[0]):
+        if control[0] != 0: break
+        _jit_threshold_gray_row(img_array, threshold, y, (y + y_offset) % threshold.shape[0], levels, first, step, out_array)
+        control[1] += 1
+    return out_array
+
+@numba.jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _jit_apply_threshold_gray_parallel(img_array, threshold, y_offset, levels, first, step, out_array, control):
+    height = img_array.shape[0]
+    for band in range(0, height, PARALLEL_PROGRESS_ROWS):
+        if control[0] != 0: break
+        band_stop = min(height, band + PARALLEL_PROGRESS_ROWS)
+        for y in numba.prange(band, band_stop):
+            _jit_threshold_gray_row(img_array, threshold, y, (y + y_offset) % threshold.shape[0], levels, first, step, out_array)
+        control[1] += band_stop - band
+    return out_array
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_apply_diffusion_gray(img_array, levels, first, step, taps, divisor, error_rows, y_offset, index_array, control):
+    # Error diffusion of the channel mean over uint8 input, with a float error ring laid out as in the fixed-point kernel.
+    height, width, _ = img_array.shape; n_rows = error_rows.shape[0]
+    for y in range(height):
+        if control[0] != 0: break
+        row = error_rows[(y_offset + y) % n_rows]
+        for x in range(width):
+            value = (np.float64(img_array[y, x, 0]) + img_array[y, x, 1] + img_array[y, x, 2]) / 3.0 + row[x]
+            index = _jit_nearest_level(value, levels, first, step); index_array[y, x] = index
+            error = value - levels[index]
+            for t in range(taps.shape[0]):
+                tx = x + taps[t, 1]
+                if 0 <= tx < width: error_rows[(y_offset + y + taps[t, 0]) % n_rows, tx] += error * taps[t, 2] / divisor
+        row[:] = 0; control[1] += 1
+    return index_array
+
+DIFFUSION_KERNELS = {"floyd_steinberg": _jit_apply_floyd_steinberg, "atkinson": _jit_apply_atkinson, "jnn": _jit_apply_jnn, "stucki": _jit_apply_stucki}
+
+class DitherCancelled(Exception):
+    pass
+
+def new_control() -> np.ndarray:
+    # Shared with the kernels: [cancel flag, rows done, rows expected]; set [0] from any thread to stop at the next row.
+    return np.zeros(3, dtype=np.int64)
+
+class WorkBuffers(threading.local):
+    # Per-thread float work array reused by consecutive error-diffusion runs on same-sized images. Off by default so
+    # one-shot callers do not keep a full-size float copy alive; sweep.py turns it on in its worker threads.
+    def __init__(self):
+        self.enabled = False; self.key = None; self.array = None
+
+    def array_from(self, image: Image.Image, precision: str) -> np.ndarray:
+        if not self.enabled: return np.array(image, dtype=precision)
+        key = (image.height, image.width, precision)
+        if self.key != key: self.key, self.array = key, np.empty((image.height, image.width, 3), dtype=precision)
+        np.copyto(self.array, np.asarray(image)); return self.array
+
+_work_buffers = WorkBuffers()
+
+def reuse_work_buffers(enabled: bool = True):
+    _work_buffers.enabled = enabled
+    if not enabled: _work_buffers.key = _work_buffers.array = None
 
 class DitherAlgorithms:
     PREDEFINED_PALETTES = {
@@ -107,53 +322,287 @@ class DitherAlgorithms:
         "PICO-8": [[0,0,0], [29,43,83], [126,37,83], [0,135,81], [171,82,54], [95,87,79], [194,195,199], [255,241,232], [255,0,77], [255,163,0], [255,236,39], [0,228,54], [41,173,255], [131,118,156], [255,119,168], [255,204,170]],
         "CGA": [[0,0,0], [0,170,0], [170,0,0], [170,85,0]]
     }
+    ALGORITHMS = {
+        "Floyd-Steinberg": "floyd_steinberg", "Atkinson": "atkinson", "Jarvis, Judice, Ninke": "jnn", "Stucki": "stucki",
+        "Bayer (Ordered)": "bayer", "Clustered Dot Halftone": "clustered_dot_halftone", "Blue Noise": "blue_noise", "Random": "random"
+    }
+    DYNAMIC_PALETTES = ["Auto (From Image)", "Grayscale"]
+    BAYER_MATRIX_8X8 = np.array([[0,32,8,40,2,34,10,42],[48,16,56,24,50,18,58,26],[12,44,4,36,14,46,6,38],[60,28,52,20,62,30,54,22],[3,35,11,43,1,33,9,41],[51,19,59,27,49,17,57,25],[15,47,7,39,13,45,5,37],[63,31,55,23,61,29,53,21]])
+    HALFTONE_MATRIX_4X4 = np.array([[12,5,6,13],[4,0,1,7],[8,2,3,9],[15,11,10,14]])
+    _palette_index_cache = {}
+    @staticmethod
+    def build_palette(image: Image.Image, palette_name: str, num_colors: int, method: str = DEFAULT_PALETTE_METHOD, digest: str = None) -> list:
+        if palette_name == "Auto (From Image)":
+            with instrumentation.span("quantize", colors=num_colors, method=method): return cached_palette(image, num_colors, method, digest)
+        if palette_name == "Grayscale":
+            return [[int(i)]*3 for i in np.linspace(0, 255, num_colors)]
+        if palette_name not in DitherAlgorithms.PREDEFINED_PALETTES:
+            raise KeyError(f"Unknown palette '{palette_name}'.")
+        return DitherAlgorithms.PREDEFINED_PALETTES[palette_name]
     @staticmethod
-    def _process_error_diffusion(image: Image.Image, palette_array: np.ndarray, strength: float, func) -> Image.Image:
-        img_array = np.array(image, dtype=np.float64)
-        if strength < 1.0: quantized_array = _jit_apply_quantization(img_array.copy(), palette_array)
-        dithered_array = func(img_array, palette_array)
-        if strength < 1.0: final_array = (dithered_array * strength) + (quantized_array * (1.0 - strength))
-        else: final_array = dithered_array
-        final_array = np.clip(final_array, 0, 255).astype(np.uint8)
-        return Image.fromarray(final_array)
+    def apply(algorithm_name: str, image: Image.Image, palette: list, strength: float, block_size: int = 1, **options) -> Image.Image:
+        if algorithm_name not in DitherAlgorithms.ALGORITHMS:
+            raise NotImplementedError(f"Algorithm '{algorithm_name}' is not implemented.")
+        if block_size > 1:
+            # Pixel-art mode: dither one pixel per block, then enlarge the result back to the source size.
+            result = DitherAlgorithms.apply(algorithm_name, DitherAlgorithms.downscale_blocks(image, block_size), palette, strength, **options)
+            return DitherAlgorithms.upscale_blocks(result, block_size, image.size)
+        instrumentation.count("pixels", image.width * image.height)
+        with instrumentation.span("dither", algorithm=algorithm_name, width=image.width, height=image.height, colors=len(palette)):
+            return getattr(DitherAlgorithms, DitherAlgorithms.ALGORITHMS[algorithm_name])(image, palette, strength, **options)
     @staticmethod
-    def floyd_steinberg(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_floyd_steinberg)
+    def downscale_blocks(image: Image.Image, block_size: int) -> Image.Image:
+        # Area average of each block_size x block_size cell; cells cut by the right or bottom edge average what they cover.
+        if block_size <= 1: return image
+        with instrumentation.span("pixelate", block_size=block_size): return image.reduce(block_size)
     @staticmethod
-    def atkinson(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_atkinson)
+    def upscale_blocks(image: Image.Image, block_size: int, size: tuple = None) -> Image.Image:
+        # Integer nearest-neighbour enlargement, cropped to size (the pre-downscale dimensions); "P" images stay indexed.
+        if block_size <= 1: return image
+        with instrumentation.span("upscale", block_size=block_size):
+            enlarged = image.resize((image.width * block_size, image.height * block_size), Image.NEAREST)
+            return enlarged.crop((0, 0) + size) if size and size != enlarged.size else enlarged
     @staticmethod
-    def jnn(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_jnn)
+    def _use_parallel(image: Image.Image, parallel) -> bool:
+        if parallel is None: return image.width * image.height >= PARALLEL_MIN_PIXELS and numba.get_num_threads() > 1
+        return parallel
     @staticmethod
-    def stucki(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_stucki)
+    def _begin(control: np.ndarray, rows: int) -> np.ndarray:
+        if control is None: control = new_control()
+        control[2] += rows
+        return control
     @staticmethod
-    def _apply_ordered_dither(image: Image.Image, palette: list, strength: float, matrix: np.ndarray) -> Image.Image:
-        img_array = np.array(image, dtype=np.float64); height, width, _ = img_array.shape; palette_array = np.array(palette, dtype=np.float64)
+    def _check_cancelled(control: np.ndarray):
+        if control[0] != 0: raise DitherCancelled()
+    @staticmethod
+    def palette_index(palette_array: np.ndarray) -> tuple:
+        # Shared across worker threads: keep the built index in a local so another thread's clear() cannot lose it.
+        key = palette_array.tobytes(); cache = DitherAlgorithms._palette_index_cache
+        index = cache.get(key)
+        if index is None:
+            index = _jit_build_palette_index(palette_array)
+            if len(cache) >= 32: cache.clear()
+            cache[key] = index
+        return index
+    @staticmethod
+    def gray_levels(palette_array: np.ndarray):
+        # (levels, first, step) when every color is a gray and the grays ascend evenly to within one step, as the
+        # Grayscale palette does; otherwise None. The nearest such color to an RGB pixel depends only on the pixel's
+        # channel mean, and diffusing each channel's error shifts that mean by the mean error, so these palettes can be
+        # dithered on one channel with the same result.
+        levels = np.ascontiguousarray(palette_array[:, 0], dtype=np.float64)
+        if len(levels) < 2 or not (palette_array == levels[:, None]).all() or not (np.diff(levels) > 0).all(): return None
+        step = (levels[-1] - levels[0]) / (len(levels) - 1)
+        if np.abs(levels - (levels[0] + step * np.arange(len(levels)))).max() > step: return None
+        return levels, levels[0], step
+    @staticmethod
+    def palette_rgb(palette_array: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(palette_array), 0, 255).astype(np.uint8)
+    @staticmethod
+    def _new_index_plane(shape: tuple, palette_array: np.ndarray) -> np.ndarray:
+        return np.empty(shape[:2], dtype=np.uint8 if len(palette_array) <= 256 else np.uint16)
+    @staticmethod
+    def indexed_image(index_array: np.ndarray, palette_rgb: np.ndarray) -> Image.Image:
+        # Palette-exact results travel as "P" images: a third of the RGB size, and recoloring only touches the palette.
+        if len(palette_rgb) > 256: return DitherAlgorithms.rgb_image(palette_rgb[index_array])
+        index_array = np.ascontiguousarray(index_array, dtype=np.uint8)
+        image = Image.frombytes('P', index_array.shape[::-1], index_array.tobytes())
+        image.putpalette(palette_rgb.tobytes()); image.source_array = index_array; return image
+    @staticmethod
+    def rgb_image(array: np.ndarray) -> Image.Image:
+        # Results keep the uint8 buffer they were built from as source_array, so display.to_qimage can hand it to Qt as is.
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        image = Image.fromarray(array); image.source_array = array; return image
+    @staticmethod
+    def _process_error_diffusion(image: Image.Image, palette_array: np.ndarray, strength: float, func, taps: tuple, parallel=None, precision="float64", control=None) -> Image.Image:
+        control = DitherAlgorithms._begin(control, image.height * (2 if strength < 1.0 else 1))
+        blend = DitherAlgorithms._diffuse(image, palette_array, func, taps, parallel, precision, control)
+        if strength < 1.0: blend.quantize(control)
+        with instrumentation.span("compose"): return blend.render(strength)
+    @staticmethod
+    def _diffuse(image: Image.Image, palette_array: np.ndarray, func, taps: tuple, parallel, precision, control) -> "StrengthBlend":
+        if precision not in PRECISIONS: raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}.")
+        palette_rgb = DitherAlgorithms.palette_rgb(palette_array)
+        index_array = DitherAlgorithms._new_index_plane((image.height, image.width), palette_array)
+        if (gray := DitherAlgorithms.gray_levels(palette_array)) is not None:
+            error_rows = np.zeros((3, image.width))
+            with instrumentation.span("kernel", kind="gray"): _jit_apply_diffusion_gray(np.asarray(image), *gray, *taps, error_rows, 0, index_array, control)
+        elif precision == "fixed":
+            offsets, candidates = DitherAlgorithms.palette_index(palette_array)
+            error_rows = np.zeros((3, image.width, 3), dtype=FIXED_ERROR_DTYPE)
+            with instrumentation.span("kernel", kind="fixed"): _jit_apply_diffusion_fixed(np.asarray(image), palette_array, offsets, candidates, *taps, error_rows, 0, index_array, palette_rgb, control)
+        else:
+            offsets, candidates = DitherAlgorithms.palette_index(palette_array)
+            with instrumentation.span("convert", dtype=precision): img_array = _work_buffers.array_from(image, precision); working_palette = palette_array.astype(precision)
+            if DitherAlgorithms._use_parallel(image, parallel):
+                with PARALLEL_KERNEL_LOCK, instrumentation.span("kernel", kind="wavefront"): _jit_apply_diffusion_wavefront(img_array, working_palette, offsets, candidates, *taps, index_array, control)
+            else:
+                with instrumentation.span("kernel", kind="serial"): func(img_array, working_palette, offsets, candidates, index_array, control)
+        DitherAlgorithms._check_cancelled(control)
+        return StrengthBlend(image, palette_array, index_array)
+    @staticmethod
+    def strength_blend(algorithm_name: str, image: Image.Image, palette: list, parallel=None, precision="float64", control=None):
+        # Full-strength run of an error-diffusion algorithm, kept so any strength can be rendered from it later; None for
+        # algorithms whose strength shapes the threshold rather than blending.
+        method = DitherAlgorithms.ALGORITHMS[algorithm_name]
+        if method not in DIFFUSION_TAPS: return None
+        control = DitherAlgorithms._begin(control, image.height)
+        with instrumentation.span("dither", algorithm=algorithm_name, width=image.width, height=image.height, colors=len(palette)):
+            return DitherAlgorithms._diffuse(image, np.array(palette, dtype=np.float64), DIFFUSION_KERNELS[method], DIFFUSION_TAPS[method], parallel, precision, control)
+    @staticmethod
+    def blend_indices(dithered: np.ndarray, quantized: np.ndarray, palette_rgb: np.ndarray, strength: float) -> Image.Image:
+        # Each output pixel depends only on its (dithered, quantized) index pair, so up to 256 colors the blend is a
+        # lookup into an n x n table of mixed colors instead of float arithmetic over the whole image. When the pairs
+        # that actually occur mix to at most 256 distinct colors, the result stays a "P" image over just those colors.
+        n = len(palette_rgb)
+        if n > 256:
+            return DitherAlgorithms.rgb_image(np.clip(palette_rgb[dithered] * strength + palette_rgb[quantized] * (1.0 - strength), 0, 255).astype(np.uint8))
+        table = np.clip(palette_rgb[:, None] * strength + palette_rgb[None, :] * (1.0 - strength), 0, 255).astype(np.uint8).reshape(-1, 3)
+        pairs = dithered.astype(np.uint16) * n + quantized
+        used = np.flatnonzero(np.bincount(pairs.ravel(), minlength=n * n))
+        colors, inverse = np.unique(table[used], axis=0, return_inverse=True)
+        if len(colors) > 256: return DitherAlgorithms.rgb_image(table[pairs])
+        lookup = np.zeros(n * n, dtype=np.uint8); lookup[used] = inverse.ravel()
+        return DitherAlgorithms.indexed_image(lookup[pairs], colors)
+    @staticmethod
+    def floyd_steinberg(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_floyd_steinberg, FLOYD_STEINBERG_TAPS, parallel, precision, control)
+    @staticmethod
+    def atkinson(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_atkinson, ATKINSON_TAPS, parallel, precision, control)
+    @staticmethod
+    def jnn(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_jnn, JNN_TAPS, parallel, precision, control)
+    @staticmethod
+    def stucki(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        palette_array = np.array(palette, dtype=np.float64); return DitherAlgorithms._process_error_diffusion(image, palette_array, strength, _jit_apply_stucki, STUCKI_TAPS, parallel, precision, control)
+    @staticmethod
+    def _apply_threshold(img_array: np.ndarray, palette_array: np.ndarray, threshold: np.ndarray, parallel: bool, y_offset: int = 0, out_array: np.ndarray = None, control: np.ndarray = None) -> np.ndarray:
+        if out_array is None: out_array = DitherAlgorithms._new_index_plane(img_array.shape, palette_array)
+        if control is None: control = new_control()
+        if (gray := DitherAlgorithms.gray_levels(palette_array)) is not None:
+            kernel = _jit_apply_threshold_gray_parallel if parallel else _jit_apply_threshold_gray
+            with PARALLEL_KERNEL_LOCK if parallel else contextlib.nullcontext(), instrumentation.span("kernel", kind="threshold_gray"): kernel(img_array, threshold, y_offset, *gray, out_array, control)
+            DitherAlgorithms._check_cancelled(control)
+            return out_array
+        offsets, candidates = DitherAlgorithms.palette_index(palette_array)
+        kernel = _jit_apply_threshold_palette_parallel if parallel else _jit_apply_threshold_palette
+        with PARALLEL_KERNEL_LOCK if parallel else contextlib.nullcontext(), instrumentation.span("kernel", kind="threshold"): kernel(img_array, threshold, y_offset, palette_array, offsets, candidates, out_array, control)
+        DitherAlgorithms._check_cancelled(control)
+        return out_array
+    @staticmethod
+    def _ordered_threshold(matrix: np.ndarray, strength: float) -> np.ndarray:
         m_size = matrix.shape[0]
-        tiled_matrix = np.tile(matrix, (height // m_size + 1, width // m_size + 1))[:height, :width]
         factor = strength * (m_size**2 / 2.0)
-        threshold = (tiled_matrix / (m_size**2) - 0.5) * factor
-        threshold = np.expand_dims(threshold, axis=2)
-        img_array += threshold
-        dithered_array = _jit_apply_bayer_palette(img_array, palette_array)
-        dithered_array = np.clip(dithered_array, 0, 255).astype(np.uint8)
-        return Image.fromarray(dithered_array)
-    @staticmethod
-    def bayer(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        bayer_matrix_8x8 = np.array([[0,32,8,40,2,34,10,42],[48,16,56,24,50,18,58,26],[12,44,4,36,14,46,6,38],[60,28,52,20,62,30,54,22],[3,35,11,43,1,33,9,41],[51,19,59,27,49,17,57,25],[15,47,7,39,13,45,5,37],[63,31,55,23,61,29,53,21]])
-        return DitherAlgorithms._apply_ordered_dither(image, palette, strength, bayer_matrix_8x8)
-    @staticmethod
-    def clustered_dot_halftone(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        halftone_matrix_4x4 = np.array([[12,5,6,13],[4,0,1,7],[8,2,3,9],[15,11,10,14]])
-        return DitherAlgorithms._apply_ordered_dither(image, palette, strength, halftone_matrix_4x4)
-    @staticmethod
-    def random(image: Image.Image, palette: list, strength: float) -> Image.Image:
-        img_array = np.array(image, dtype=np.float64)
-        palette_array = np.array(palette, dtype=np.float64)
-        noise = np.random.uniform(-1, 1, img_array.shape) * (strength * 25)
-        img_array += noise
-        dithered_array = _jit_apply_bayer_palette(img_array, palette_array)
-        dithered_array = np.clip(dithered_array, 0, 255).astype(np.uint8)
-        return Image.fromarray(dithered_array)
\ No newline at end of file
+        threshold = (matrix / (m_size**2) - 0.5) * factor
+        return np.expand_dims(threshold, axis=2)
+    @staticmethod
+    def _blue_noise_threshold(palette_array: np.ndarray, strength: float) -> np.ndarray:
+        # Unlike the small matrices, the texture's amplitude follows the palette: it spans the median per-channel gap
+        # between neighbouring palette colors, so every tone between two entries gets its proportional mix.
+        if len(palette_array) < 2: return np.zeros((1, 1, 1))
+        distances = np.sqrt(((palette_array[:, None] - palette_array[None]) ** 2).sum(axis=2)); np.fill_diagonal(distances, np.inf)
+        spacing = np.median(distances.min(axis=1)) / np.sqrt(3)
+        return np.expand_dims((bluenoise.texture() - 0.5) * spacing * strength, axis=2)
+    @staticmethod
+    def _apply_ordered_dither(image: Image.Image, palette: list, threshold_for, parallel=None, control=None) -> Image.Image:
+        img_array = np.asarray(image); palette_array = np.array(palette, dtype=np.float64)
+        threshold = threshold_for(palette_array)
+        control = DitherAlgorithms._begin(control, image.height)
+        index_array = DitherAlgorithms._apply_threshold(img_array, palette_array, threshold, DitherAlgorithms._use_parallel(image, parallel), control=control)
+        with instrumentation.span("compose"): return DitherAlgorithms.indexed_image(index_array, DitherAlgorithms.palette_rgb(palette_array))
+    @staticmethod
+    def bayer(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        return DitherAlgorithms._apply_ordered_dither(image, palette, lambda _: DitherAlgorithms._ordered_threshold(DitherAlgorithms.BAYER_MATRIX_8X8, strength), parallel, control)
+    @staticmethod
+    def clustered_dot_halftone(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        return DitherAlgorithms._apply_ordered_dither(image, palette, lambda _: DitherAlgorithms._ordered_threshold(DitherAlgorithms.HALFTONE_MATRIX_4X4, strength), parallel, control)
+    @staticmethod
+    def blue_noise(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None) -> Image.Image:
+        return DitherAlgorithms._apply_ordered_dither(image, palette, lambda palette_array: DitherAlgorithms._blue_noise_threshold(palette_array, strength), parallel, control)
+    @staticmethod
+    def random(image: Image.Image, palette: list, strength: float, parallel=None, precision="float64", control=None, seed=None) -> Image.Image:
+        img_array = np.asarray(image); height, width, _ = img_array.shape; control = DitherAlgorithms._begin(control, height)
+        palette_array = np.array(palette, dtype=np.float64); parallel = DitherAlgorithms._use_parallel(image, parallel)
+        index_array = DitherAlgorithms._new_index_plane(img_array.shape, palette_array)
+        rng = np.random.default_rng(seed) if seed is not None else np.random
+        for y in range(0, height, THRESHOLD_BAND_ROWS):
+            band = slice(y, min(height, y + THRESHOLD_BAND_ROWS))
+            with instrumentation.span("noise"): noise = rng.uniform(-1, 1, (band.stop - y, width, 3)) * (strength * 25)
+            DitherAlgorithms._apply_threshold(img_array[band], palette_array, noise, parallel, out_array=index_array[band], control=control)
+        with instrumentation.span("compose"): return DitherAlgorithms.indexed_image(index_array, DitherAlgorithms.palette_rgb(palette_array))
+
+class StrengthBlend:
+    # Full-strength error-diffusion indices of one image and palette, plus (once needed) its plain-quantized indices.
+    # Error-diffusion strength only mixes the two, so every other strength is rendered without another diffusion pass.
+    def __init__(self, image: Image.Image, palette_array: np.ndarray, dithered: np.ndarray):
+        self.image = image
+        self.palette_array = palette_array
+        self.palette_rgb = DitherAlgorithms.palette_rgb(palette_array)
+        self.dithered = dithered
+        self.quantized = None
+
+    def quantize(self, control=None):
+        if self.quantized is None:
+            self.quantized = DitherAlgorithms._apply_threshold(np.asarray(self.image), self.palette_array, np.zeros((1, 1, 1)), False, control=control)
+        return self.quantized
+
+    def render(self, strength: float) -> Image.Image:
+        if strength >= 1.0: return DitherAlgorithms.indexed_image(self.dithered, self.palette_rgb)
+        with instrumentation.span("blend", strength=strength): return DitherAlgorithms.blend_indices(self.dithered, self.quantize(), self.palette_rgb, strength)
+
+class BandDitherer:
+    # Dithers an image delivered as consecutive row bands; error-diffusion state is the fixed-point error ring, so memory
+    # stays proportional to the band size whatever the image height.
+    def __init__(self, algorithm_name: str, palette: list, strength: float, width: int, parallel=None, control=None):
+        if algorithm_name not in DitherAlgorithms.ALGORITHMS:
+            raise NotImplementedError(f"Algorithm '{algorithm_name}' is not implemented.")
+        self.method = DitherAlgorithms.ALGORITHMS[algorithm_name]
+        self.strength = strength
+        self.parallel = parallel if parallel is not None else numba.get_num_threads() > 1
+        self.palette_array = np.array(palette, dtype=np.float64)
+        self.palette_rgb = DitherAlgorithms.palette_rgb(self.palette_array)
+        self.gray = DitherAlgorithms.gray_levels(self.palette_array)
+        if self.gray is None: self.offsets, self.candidates = DitherAlgorithms.palette_index(self.palette_array)
+        self.error_rows = np.zeros((3, width, 3), dtype=FIXED_ERROR_DTYPE) if self.gray is None else np.zeros((3, width))
+        self.control = control if control is not None else new_control()
+        if self.method == "bayer": self.threshold = DitherAlgorithms._ordered_threshold(DitherAlgorithms.BAYER_MATRIX_8X8, strength)
+        elif self.method == "clustered_dot_halftone": self.threshold = DitherAlgorithms._ordered_threshold(DitherAlgorithms.HALFTONE_MATRIX_4X4, strength)
+        elif self.method == "blue_noise": self.threshold = DitherAlgorithms._blue_noise_threshold(self.palette_array, strength)
+        else: self.threshold = None
+
+    def __call__(self, band: np.ndarray, y_offset: int) -> np.ndarray:
+        band = np.ascontiguousarray(band, dtype=np.uint8)
+        if self.threshold is not None:
+            return self.palette_rgb[DitherAlgorithms._apply_threshold(band, self.palette_array, self.threshold, self.parallel, y_offset, control=self.control)]
+        if self.method == "random":
+            noise = np.random.uniform(-1, 1, band.shape) * (self.strength * 25)
+            return self.palette_rgb[DitherAlgorithms._apply_threshold(band, self.palette_array, noise, self.parallel, control=self.control)]
+        index_array = DitherAlgorithms._new_index_plane(band.shape, self.palette_array)
+        if self.gray is not None: _jit_apply_diffusion_gray(band, *self.gray, *DIFFUSION_TAPS[self.method], self.error_rows, y_offset, index_array, self.control)
+        else: _jit_apply_diffusion_fixed(band, self.palette_array, self.offsets, self.candidates, *DIFFUSION_TAPS[self.method], self.error_rows, y_offset, index_array, self.palette_rgb, self.control)
+        DitherAlgorithms._check_cancelled(self.control)
+        dithered = self.palette_rgb[index_array]
+        if self.strength >= 1.0: return dithered
+        quantized = self.palette_rgb[DitherAlgorithms._apply_threshold(band, self.palette_array, np.zeros((1, 1, 1)), self.parallel, control=self.control)]
+        return np.clip(dithered * self.strength + quantized * (1.0 - self.strength), 0, 255).astype(np.uint8)
+
+def warm_up_kernels(algorithm_names=None) -> dict:
+    # Runs every algorithm on a tiny image in each mode it can dispatch to, compiling (or loading from Numba's on-disk
+    # cache) every kernel specialization, and returns first-call vs. repeat-call seconds per algorithm.
+    ramp = (np.add.outer(np.arange(16), np.arange(16)) * 8 % 256).astype(np.uint8)
+    sample = Image.fromarray(np.dstack((ramp, ramp[::-1], ramp.T)))
+    palette = DitherAlgorithms.PREDEFINED_PALETTES["PICO-8"]; gray = DitherAlgorithms.build_palette(None, "Grayscale", 4)
+    for method in ("kmeans", "median_cut"): extract_palette(sample, 8, method)
+    timings = {}
+    for name in algorithm_names or DitherAlgorithms.ALGORITHMS:
+        runs = []
+        for _ in range(2):
+            start = time.perf_counter()
+            for strength in (1.0, 0.5):
+                for precision in PRECISIONS: DitherAlgorithms.apply(name, sample, palette, strength, parallel=False, precision=precision)
+                DitherAlgorithms.apply(name, sample, palette, strength, parallel=True)
+                for parallel in (False, True): DitherAlgorithms.apply(name, sample, gray, strength, parallel=parallel)
+            runs.append(time.perf_counter() - start)
+        timings[name] = {'cold_seconds': runs[0], 'warm_seconds': runs[1]}
+    return timings
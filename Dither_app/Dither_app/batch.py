@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from algorithms import DitherAlgorithms
+from palette import DEFAULT_PALETTE_METHOD
+from cache import ResultCache, configure_shared_cache, shared_cache
+from encoding import save_result
+import instrumentation
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+def _init_worker(dither_params, cache_dir, trace_memory=None):
+    if cache_dir: configure_shared_cache(disk_dir=cache_dir)
+    if trace_memory is not None: instrumentation.enable(trace_memory)
+    _warm_up(dither_params)
+    instrumentation.clear()
+
+def _warm_up(dither_params):
+    sample = Image.new('RGB', (8, 8), (128, 64, 32))
+    palette_rgb = DitherAlgorithms.build_palette(sample, dither_params['palette_name'], dither_params['num_colors'], dither_params.get('palette_method', DEFAULT_PALETTE_METHOD))
+    for strength in (1.0, 0.5):
+        DitherAlgorithms.apply(dither_params['algorithm_name'], sample, palette_rgb, strength, precision=dither_params.get('precision', "float64"), block_size=dither_params.get('block_size', 1))
+
+def _dither_file(src_path, dst_path, dither_params, bit_layout="packed"):
+    start = time.perf_counter()
+    with instrumentation.span("file", path=src_path):
+        with instrumentation.span("decode"): image = Image.open(src_path).convert('RGB')
+        cache_key = ResultCache.make_key(ResultCache.image_digest(image), dither_params) if shared_cache().disk_dir else None
+        cached = shared_cache().get(cache_key) if cache_key else None
+        if cached:
+            result = cached[0]
+        else:
+            with instrumentation.span("palette"): palette_rgb = DitherAlgorithms.build_palette(image, dither_params['palette_name'], dither_params['num_colors'], dither_params.get('palette_method', DEFAULT_PALETTE_METHOD))
+            result = DitherAlgorithms.apply(dither_params['algorithm_name'], image, palette_rgb, dither_params['dither_strength'] / 100.0, precision=dither_params.get('precision', "float64"), block_size=dither_params.get('block_size', 1))
+            if cache_key: shared_cache().put(cache_key, result, palette_rgb)
+        with instrumentation.span("encode"): save_result(result, dst_path, bit_layout)
+    trace = None
+    if instrumentation.enabled(): trace = instrumentation.trace(); instrumentation.clear()
+    return src_path, image.width * image.height, time.perf_counter() - start, trace
+
+def find_images(input_dir):
+    return sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def run_batch(input_dir, output_dir, dither_params, workers=None, progress=None, cache_dir=None, output_format="png", bit_layout="packed"):
+    if dither_params['algorithm_name'] not in DitherAlgorithms.ALGORITHMS:
+        raise NotImplementedError(f"Algorithm '{dither_params['algorithm_name']}' is not implemented.")
+    os.makedirs(output_dir, exist_ok=True)
+    files = find_images(input_dir)
+    stats = {'images': 0, 'failed': 0, 'pixels': 0, 'cpu_seconds': 0.0, 'errors': []}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dither_params, cache_dir, instrumentation.memory_tracing() if instrumentation.enabled() else None)) as pool:
+        futures = {}
+        for src_path in files:
+            dst_path = os.path.join(output_dir, os.path.splitext(os.path.basename(src_path))[0] + '.' + output_format)
+            futures[pool.submit(_dither_file, src_path, dst_path, dither_params, bit_layout)] = src_path
+        for future in as_completed(futures):
+            try:
+                _, pixels, seconds, trace = future.result()
+                if trace: instrumentation.merge(trace)
+                stats['images'] += 1; stats['pixels'] += pixels; stats['cpu_seconds'] += seconds
+            except Exception as e:
+                stats['failed'] += 1; stats['errors'].append((futures[future], str(e)))
+            if progress: progress(stats['images'] + stats['failed'], len(files), futures[future])
+    stats['wall_seconds'] = time.perf_counter() - start
+    stats['images_per_second'] = stats['images'] / stats['wall_seconds'] if stats['wall_seconds'] else 0.0
+    stats['megapixels_per_second'] = stats['pixels'] / 1e6 / stats['wall_seconds'] if stats['wall_seconds'] else 0.0
+    return stats
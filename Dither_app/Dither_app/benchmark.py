@@ -0,0 +1,95 @@
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import numba
+import PIL
+from PIL import Image
+from algorithms import DitherAlgorithms
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_MEGAPIXELS = (1, 12, 50)
+DEFAULT_COLORS = (2, 4, 16, 64, 256)
+DEFAULT_STRENGTHS = (100, 50)
+DEFAULT_TOLERANCE = 0.10
+BENCHMARK_SEED = 1234
+
+def synthetic_image(megapixels: float, seed: int = BENCHMARK_SEED) -> Image.Image:
+    # 4:3 frame of smooth color ramps plus fixed-seed noise, so every kernel sees both flat gradients and texture.
+    height = max(1, round((megapixels * 1e6 * 3 / 4) ** 0.5)); width = max(1, round(megapixels * 1e6 / height))
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32); y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img_array = np.empty((height, width, 3), dtype=np.uint8)
+    for c, ramp in enumerate((np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2)):
+        img_array[:, :, c] = np.clip(ramp + rng.normal(0, 24, (height, width)).astype(np.float32), 0, 255)
+    return Image.fromarray(img_array)
+
+def synthetic_palette(num_colors: int, seed: int = BENCHMARK_SEED) -> list:
+    rng = np.random.default_rng(seed + num_colors)
+    palette = rng.integers(0, 256, (num_colors, 3)); palette[0] = 0; palette[-1] = 255
+    return palette.tolist()
+
+def peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _run_case(case: dict) -> dict:
+    # Runs in a fresh process so the first call measures JIT compile / cache load and ru_maxrss covers this case only.
+    image = synthetic_image(case['megapixels']); palette = synthetic_palette(case['colors'])
+    rss_before = peak_rss_mb(); options = {'precision': case['precision']}
+    if case['parallel'] is not None: options['parallel'] = case['parallel']
+    timings = []
+    for _ in range(case['repeats'] + 1):
+        np.random.seed(BENCHMARK_SEED)
+        start = time.perf_counter()
+        DitherAlgorithms.apply(case['algorithm'], image, palette, case['strength'] / 100.0, **options)
+        timings.append(time.perf_counter() - start)
+    warm = statistics.median(timings[1:])
+    megapixels = image.width * image.height / 1e6
+    return dict(case, width=image.width, height=image.height, cold_seconds=timings[0], warm_seconds=warm, jit_seconds=max(0.0, timings[0] - warm),
+                megapixels_per_second=megapixels / warm if warm else 0.0, input_rss_mb=rss_before, peak_rss_mb=peak_rss_mb())
+
+def environment() -> dict:
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'numba': numba.__version__, 'pillow': PIL.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'numba_threads': numba.config.NUMBA_NUM_THREADS, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+def run_benchmark(algorithms=None, megapixels=DEFAULT_MEGAPIXELS, colors=DEFAULT_COLORS, strengths=DEFAULT_STRENGTHS, repeats=3, precision="float64", parallel=None, progress=None) -> dict:
+    cases = [{'algorithm': algorithm, 'megapixels': mp, 'colors': n, 'strength': strength, 'precision': precision, 'parallel': parallel, 'repeats': repeats}
+             for mp in megapixels for algorithm in (algorithms or DitherAlgorithms.ALGORITHMS) for n in colors for strength in strengths]
+    results = []
+    for i, case in enumerate(cases):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results.append(pool.submit(_run_case, case).result())
+        if progress: progress(i + 1, len(cases), results[-1])
+    return {'environment': environment(), 'results': results}
+
+def case_key(result: dict) -> tuple:
+    return (result['algorithm'], result['megapixels'], result['colors'], result['strength'], result['precision'], result['parallel'])
+
+def compare(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    # Flags every case whose throughput fell more than `tolerance` below the baseline's; cases missing there are skipped.
+    previous = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = previous.get(case_key(result))
+        if old and result['megapixels_per_second'] < old['megapixels_per_second'] * (1.0 - tolerance):
+            regressions.append({'case': case_key(result), 'baseline_mp_s': old['megapixels_per_second'], 'current_mp_s': result['megapixels_per_second'],
+                                'change': result['megapixels_per_second'] / old['megapixels_per_second'] - 1.0})
+    return regressions
+
+def save_report(report: dict, path: str):
+    with open(path, 'w') as f: json.dump(report, f, indent=2)
+
+def load_report(path: str) -> dict:
+    with open(path) as f: return json.load(f)
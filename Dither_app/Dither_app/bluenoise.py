@@ -0,0 +1,101 @@
+import os
+import threading
+import numpy as np
+import numba
+from fileio import write_atomic
+
+BLUE_NOISE_SIZE = 128
+BLUE_NOISE_SIGMA = 1.5
+BLUE_NOISE_SEED = 7
+INITIAL_DENSITY = 0.1
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_splat(energy, kernel, y, x, sign):
+    # Adds (or removes) one pixel's toroidal Gaussian footprint to the energy map.
+    size = energy.shape[0]; radius = kernel.shape[0] // 2
+    for dy in range(-radius, radius + 1):
+        row = (y + dy) % size
+        for dx in range(-radius, radius + 1):
+            energy[row, (x + dx) % size] += sign * kernel[dy + radius, dx + radius]
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_extreme(energy, pattern, value, largest):
+    # Flat index of the highest (largest=True) or lowest energy among pixels whose pattern bit equals value.
+    best = -np.inf if largest else np.inf; best_index = -1
+    flat_energy = energy.ravel(); flat_pattern = pattern.ravel()
+    for i in range(flat_energy.shape[0]):
+        if flat_pattern[i] != value: continue
+        e = flat_energy[i]
+        if (largest and e > best) or (not largest and e < best): best = e; best_index = i
+    return best_index
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_void_and_cluster(size, kernel, seed):
+    # Ulichney's void-and-cluster: relax a random seed pattern until no cluster/void swap helps, then rank every pixel by
+    # removing tightest clusters (phase 1), filling largest voids up to half (phase 2) and, with the roles of 0 and 1
+    # swapped, filling the remaining tightest clusters of zeros (phase 3).
+    np.random.seed(seed)
+    n = size * size; pattern = np.zeros((size, size), dtype=np.uint8); energy = np.zeros((size, size))
+    ones = max(1, int(n * INITIAL_DENSITY))
+    for i in np.random.permutation(n)[:ones]:
+        pattern[i // size, i % size] = 1; _jit_splat(energy, kernel, i // size, i % size, 1.0)
+    for _ in range(n):
+        cluster = _jit_extreme(energy, pattern, 1, True)
+        pattern[cluster // size, cluster % size] = 0; _jit_splat(energy, kernel, cluster // size, cluster % size, -1.0)
+        void = _jit_extreme(energy, pattern, 0, False)
+        pattern[void // size, void % size] = 1; _jit_splat(energy, kernel, void // size, void % size, 1.0)
+        if void == cluster: break
+    ranks = np.zeros((size, size), dtype=np.int64)
+    prototype = pattern.copy(); prototype_energy = energy.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = _jit_extreme(energy, pattern, 1, True)
+        pattern[cluster // size, cluster % size] = 0; _jit_splat(energy, kernel, cluster // size, cluster % size, -1.0)
+        ranks[cluster // size, cluster % size] = rank
+    pattern = prototype; energy = prototype_energy
+    for rank in range(ones, n // 2):
+        void = _jit_extreme(energy, pattern, 0, False)
+        pattern[void // size, void % size] = 1; _jit_splat(energy, kernel, void // size, void % size, 1.0)
+        ranks[void // size, void % size] = rank
+    energy = np.zeros((size, size))
+    for y in range(size):
+        for x in range(size):
+            if pattern[y, x] == 0: _jit_splat(energy, kernel, y, x, 1.0)
+    for rank in range(n // 2, n):
+        cluster = _jit_extreme(energy, pattern, 0, True)
+        pattern[cluster // size, cluster % size] = 1; _jit_splat(energy, kernel, cluster // size, cluster % size, -1.0)
+        ranks[cluster // size, cluster % size] = rank
+    return ranks
+
+def gaussian_kernel(sigma: float = BLUE_NOISE_SIGMA) -> np.ndarray:
+    radius = int(np.ceil(4 * sigma)); offsets = np.arange(-radius, radius + 1)
+    return np.exp(-(offsets[:, None]**2 + offsets[None, :]**2) / (2 * sigma**2))
+
+def generate(size: int = BLUE_NOISE_SIZE, seed: int = BLUE_NOISE_SEED) -> np.ndarray:
+    # Threshold texture in (0, 1): every value (rank + 0.5) / size**2 appears exactly once and tiles seamlessly.
+    kernel = gaussian_kernel()
+    if kernel.shape[0] > size: raise ValueError(f"Blue noise textures must be at least {kernel.shape[0]} pixels wide.")
+    return (_jit_void_and_cluster(size, kernel, seed) + 0.5) / (size * size)
+
+def cache_dir() -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'dither-pro')
+
+_textures = {}
+_lock = threading.Lock()
+
+def texture(size: int = BLUE_NOISE_SIZE, seed: int = BLUE_NOISE_SEED) -> np.ndarray:
+    # Generated once per (size, seed) and kept on disk; an unwritable cache directory only costs regenerating next run.
+    with _lock:
+        if (size, seed) in _textures: return _textures[(size, seed)]
+        path = os.path.join(cache_dir(), f"bluenoise_{size}_{seed}.npy")
+        try:
+            values = np.load(path)
+            if values.shape != (size, size): raise ValueError(path)
+        except (OSError, ValueError):
+            values = generate(size, seed)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_atomic(path, lambda f: np.save(f, values))
+            except OSError:
+                pass
+        _textures[(size, seed)] = values
+        return values
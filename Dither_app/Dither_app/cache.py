@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from algorithms import DitherAlgorithms
+from palette import DEFAULT_PALETTE_METHOD
+from fileio import write_atomic
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+KEY_PARAMS = ('algorithm_name', 'palette_name', 'num_colors', 'dither_strength', 'precision', 'palette_method')
+
+class ResultCache:
+    # LRU of dithered results bounded by decoded size, optionally backed by a content-addressed PNG store on disk
+    # that several processes can share.
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES, disk_dir: str = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+    @staticmethod
+    def image_digest(image: Image.Image) -> str:
+        digest = hashlib.sha1(f"{image.mode}:{image.width}x{image.height}:".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(digest: str, dither_params: dict) -> str:
+        params = {name: dither_params.get(name) for name in KEY_PARAMS}
+        if params['palette_name'] not in DitherAlgorithms.DYNAMIC_PALETTES: params['num_colors'] = None
+        params['palette_method'] = (params['palette_method'] or DEFAULT_PALETTE_METHOD) if params['palette_name'] == "Auto (From Image)" else None
+        # Only present when pixelating, so keys of full-resolution results are unchanged.
+        if (dither_params.get('block_size') or 1) > 1: params['block_size'] = dither_params['block_size']
+        return hashlib.sha1((digest + json.dumps(params, sort_keys=True)).encode()).hexdigest()
+
+    def _disk_paths(self, key: str) -> tuple:
+        folder = os.path.join(self.disk_dir, key[:2])
+        return os.path.join(folder, key + '.png'), os.path.join(folder, key + '.json')
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key); self.hits += 1
+                return self._entries[key][:2]
+        if self.disk_dir:
+            image_path, palette_path = self._disk_paths(key)
+            if os.path.exists(image_path) and os.path.exists(palette_path):
+                try:
+                    image = Image.open(image_path); image.load()
+                    with open(palette_path) as f: palette = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                else:
+                    self._store(key, image, palette)
+                    with self._lock: self.hits += 1; self.disk_hits += 1
+                    return image, palette
+        with self._lock: self.misses += 1
+        return None
+
+    def put(self, key: str, image: Image.Image, palette: list):
+        self._store(key, image, palette)
+        if self.disk_dir:
+            image_path, palette_path = self._disk_paths(key)
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
+            write_atomic(image_path, lambda f: image.save(f, format='PNG'))
+            write_atomic(palette_path, lambda f: f.write(json.dumps([list(map(int, color)) for color in palette]).encode()))
+
+    def _store(self, key: str, image: Image.Image, palette: list):
+        size = image.width * image.height * len(image.getbands())
+        if getattr(image, 'source_array', None) is not None: size += image.source_array.nbytes
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (image, palette, size); self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False); self._bytes -= evicted; self.evictions += 1
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+_shared_cache = None
+
+def shared_cache() -> ResultCache:
+    global _shared_cache
+    if _shared_cache is None: _shared_cache = ResultCache()
+    return _shared_cache
+
+def configure_shared_cache(max_bytes: int = DEFAULT_CACHE_BYTES, disk_dir: str = None) -> ResultCache:
+    global _shared_cache
+    _shared_cache = ResultCache(max_bytes, disk_dir)
+    return _shared_cache
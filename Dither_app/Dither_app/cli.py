@@ -0,0 +1,197 @@
+import argparse
+import sys
+import time
+from algorithms import DitherAlgorithms, PRECISIONS, warm_up_kernels
+from palette import DEFAULT_PALETTE_METHOD, PALETTE_METHODS
+from encoding import BIT_LAYOUTS
+from benchmark import DEFAULT_COLORS, DEFAULT_MEGAPIXELS, DEFAULT_STRENGTHS, DEFAULT_TOLERANCE
+
+def _add_dither_arguments(parser):
+    parser.add_argument('--algorithm', default="Floyd-Steinberg", choices=list(DitherAlgorithms.ALGORITHMS))
+    parser.add_argument('--palette', default="Auto (From Image)", choices=DitherAlgorithms.DYNAMIC_PALETTES + list(DitherAlgorithms.PREDEFINED_PALETTES))
+    parser.add_argument('--colors', type=int, default=8, help="Number of colors for dynamic palettes (2-256).")
+    parser.add_argument('--strength', type=int, default=100, help="Dithering strength in percent (0-100).")
+    parser.add_argument('--palette-method', default=DEFAULT_PALETTE_METHOD, choices=PALETTE_METHODS, help="How 'Auto (From Image)' palettes are extracted.")
+    parser.add_argument('--precision', default="float64", choices=PRECISIONS, help="Error diffusion working precision; fixed diffuses integer fixed-point error through a rolling 3-row buffer instead of a full-frame float array.")
+    parser.add_argument('--block-size', type=int, default=1, help="Pixel-art mode: dither one pixel per NxN block (area-averaged), then enlarge with nearest neighbour.")
+
+def _dither_params(args):
+    return {'algorithm_name': args.algorithm, 'palette_name': args.palette, 'num_colors': args.colors, 'dither_strength': args.strength, 'precision': args.precision, 'palette_method': args.palette_method,
+            'block_size': args.block_size}
+
+def _run_batch(args):
+    from batch import run_batch
+    def progress(done, total, path):
+        print(f"[{done}/{total}] {path}", file=sys.stderr)
+    stats = run_batch(args.input_dir, args.output_dir, _dither_params(args), workers=args.workers, progress=None if args.quiet else progress, cache_dir=args.cache_dir,
+                      output_format=args.format, bit_layout=args.bit_layout)
+    for path, message in stats['errors']:
+        print(f"Failed: {path}: {message}", file=sys.stderr)
+    print(f"Dithered {stats['images']} images ({stats['pixels'] / 1e6:.1f} MP) in {stats['wall_seconds']:.2f}s: "
+          f"{stats['images_per_second']:.2f} images/s, {stats['megapixels_per_second']:.2f} MP/s")
+    return 1 if stats['failed'] else 0
+
+def _run_stream(args):
+    from streaming import dither_file_streaming
+    raw_size = tuple(int(v) for v in args.raw_size.lower().split('x')) if args.raw_size else None
+    def progress(done, total):
+        print(f"\r{done}/{total} rows", end='', file=sys.stderr)
+    start = time.perf_counter()
+    info = dither_file_streaming(args.input, args.output, _dither_params(args), band_rows=args.band_rows, raw_size=raw_size, progress=None if args.quiet else progress)
+    seconds = time.perf_counter() - start
+    if not args.quiet: print(file=sys.stderr)
+    print(f"Dithered {info['width']}x{info['height']} in {seconds:.2f}s: {info['width'] * info['height'] / 1e6 / seconds:.2f} MP/s")
+    return 0
+
+def _run_sequence(args):
+    from sequence import dither_sequence
+    def progress(done, total):
+        print(f"\r{done}/{total} frames", end='', file=sys.stderr)
+    start = time.perf_counter()
+    info = dither_sequence(args.input, args.output, _dither_params(args), workers=args.workers, queue_frames=args.queue_frames, stable=args.stable, progress=None if args.quiet else progress)
+    seconds = time.perf_counter() - start
+    if not args.quiet: print(file=sys.stderr)
+    print(f"Dithered {info['frames']} frames in {seconds:.2f}s: {info['frames'] / seconds:.2f} frames/s")
+    return 0
+
+def _run_sweep(args):
+    import json
+    from PIL import Image
+    from sweep import sweep_configs, run_sweep, contact_sheet
+    configs = sweep_configs(args.algorithm or ["Floyd-Steinberg", "Bayer (Ordered)", "Blue Noise"], args.palette or ["Auto (From Image)"],
+                            args.strengths, args.colors, args.precision, args.palette_method, args.block_sizes)
+    def progress(done, total, result):
+        print(f"[{done}/{total}] {result['params']['algorithm_name']:<24} {result['params']['palette_name']:<20} {result['params']['num_colors']:>3} colors "
+              f"{result['params']['dither_strength']:>3}%: {result['seconds'] * 1000:8.1f} ms", file=sys.stderr)
+    start = time.perf_counter()
+    with Image.open(args.input) as image:
+        results = run_sweep(image, configs, workers=args.workers, max_pixels=int(args.max_megapixels * 1e6) if args.max_megapixels else None,
+                            progress=None if args.quiet else progress)
+    contact_sheet(results, args.columns, (args.cell_width, args.cell_height)).save(args.output)
+    if args.timings:
+        with open(args.timings, 'w') as f: json.dump([{**result['params'], 'seconds': result['seconds']} for result in results], f, indent=2)
+    print(f"Rendered {len(results)} configurations in {time.perf_counter() - start:.2f}s")
+    return 0
+
+def _run_serve(args):
+    from service import serve
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Serving on {where}" + ("" if args.no_warmup else " after warming kernels"), file=sys.stderr)
+    try:
+        serve(args.host, args.port, args.socket, args.workers, args.queue_size, args.max_batch, int(args.cache_mb * 1024 * 1024), not args.no_warmup, args.quiet)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def _run_warmup(args):
+    timings = warm_up_kernels(args.algorithm or None)
+    for name, timing in timings.items():
+        print(f"{name:<24} first {timing['cold_seconds']:8.3f}s  repeat {timing['warm_seconds']:8.3f}s")
+    print(f"{'Total':<24} first {sum(t['cold_seconds'] for t in timings.values()):8.3f}s")
+    return 0
+
+def _run_benchmark(args):
+    from benchmark import run_benchmark, compare, save_report, load_report
+    def progress(done, total, result):
+        print(f"[{done}/{total}] {result['algorithm']:<24} {result['megapixels']:>4} MP {result['colors']:>3} colors {result['strength']:>3}%: "
+              f"{result['megapixels_per_second']:7.2f} MP/s  cold {result['cold_seconds']:7.2f}s  warm {result['warm_seconds']:7.2f}s  "
+              f"peak {result['peak_rss_mb'] or 0:7.0f} MB", file=sys.stderr)
+    report = run_benchmark(args.algorithm, args.megapixels, args.colors, args.strengths, args.repeats, args.precision,
+                           None if args.parallel == "auto" else args.parallel == "on", progress=None if args.quiet else progress)
+    if args.output: save_report(report, args.output)
+    if not args.baseline: return 0
+    regressions = compare(report, load_report(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression['case']}: {regression['baseline_mp_s']:.2f} -> {regression['current_mp_s']:.2f} MP/s ({regression['change']:+.1%})")
+    print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="dither", description="Headless Dither-Pro tools.")
+    parser.add_argument('--trace', default=None, help="Record per-stage timing spans and counters and write them to this JSON file.")
+    parser.add_argument('--trace-memory', action='store_true', help="Also track peak allocations per span with tracemalloc (slower).")
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help="Dither every image in a directory using a process pool.")
+    batch.add_argument('input_dir')
+    batch.add_argument('output_dir')
+    _add_dither_arguments(batch)
+    batch.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    batch.add_argument('--cache-dir', default=None, help="Content-addressed result store shared by all workers and later runs.")
+    batch.add_argument('--format', default="png", choices=["png", "bin"], help="png: indexed PNG at 1/2/4/8 bits per pixel; bin: headerless packed indices plus a JSON sidecar.")
+    batch.add_argument('--bit-layout', default="packed", choices=BIT_LAYOUTS, help="For --format bin: pixels packed per byte, or one 1-bit plane per index bit.")
+    batch.add_argument('--quiet', action='store_true')
+    batch.set_defaults(func=_run_batch)
+    stream = commands.add_parser('stream', help="Dither one large image in row bands with a fixed memory ceiling.")
+    stream.add_argument('input', help="Uncompressed TIFF, memory-mapped .npy, headless RGB .raw (needs --raw-size), or a smaller image of any format.")
+    stream.add_argument('output', help="Output .png, .tif/.tiff or .npy, written band by band.")
+    _add_dither_arguments(stream)
+    stream.add_argument('--band-rows', type=int, default=256)
+    stream.add_argument('--raw-size', default=None, help="WIDTHxHEIGHT of a .raw input.")
+    stream.add_argument('--quiet', action='store_true')
+    stream.set_defaults(func=_run_stream)
+    sequence = commands.add_parser('sequence', help="Dither an animated GIF/APNG/WebP or a directory of frames with one palette for the whole clip.")
+    sequence.add_argument('input', help="Animated image, or a directory of frames in name order.")
+    sequence.add_argument('output', help="Output .gif/.png/.apng/.webp, or a directory to receive one PNG per frame.")
+    _add_dither_arguments(sequence)
+    sequence.add_argument('--workers', type=int, default=None, help="Frames dithered concurrently (default: CPU count).")
+    sequence.add_argument('--queue-frames', type=int, default=8, help="Decoded frames allowed in flight ahead of the encoder.")
+    sequence.add_argument('--stable', action='store_true', help="Reuse the same noise field on every frame so static areas do not flicker.")
+    sequence.add_argument('--quiet', action='store_true')
+    sequence.set_defaults(func=_run_sequence)
+    sweep = commands.add_parser('sweep', help="Render one image under many dithering configurations into a labelled contact sheet.")
+    sweep.add_argument('input')
+    sweep.add_argument('output', help="Contact sheet image.")
+    sweep.add_argument('--algorithm', action='append', choices=list(DitherAlgorithms.ALGORITHMS), help="Algorithm to include (repeatable).")
+    sweep.add_argument('--palette', action='append', choices=DitherAlgorithms.DYNAMIC_PALETTES + list(DitherAlgorithms.PREDEFINED_PALETTES), help="Palette to include (repeatable).")
+    sweep.add_argument('--colors', type=int, nargs='+', default=[8], help="Color counts for dynamic palettes.")
+    sweep.add_argument('--strengths', type=int, nargs='+', default=[100])
+    sweep.add_argument('--block-sizes', type=int, nargs='+', default=[1], help="Pixel-art block sizes to compare (1 = full resolution).")
+    sweep.add_argument('--palette-method', default=DEFAULT_PALETTE_METHOD, choices=PALETTE_METHODS)
+    sweep.add_argument('--precision', default="float64", choices=PRECISIONS)
+    sweep.add_argument('--workers', type=int, default=None, help="Configurations rendered concurrently (default: CPU count).")
+    sweep.add_argument('--max-megapixels', type=float, default=None, help="Downscale the input to at most this size first.")
+    sweep.add_argument('--columns', type=int, default=None)
+    sweep.add_argument('--cell-width', type=int, default=320)
+    sweep.add_argument('--cell-height', type=int, default=240)
+    sweep.add_argument('--timings', default=None, help="Write per-configuration timings to this JSON file.")
+    sweep.add_argument('--quiet', action='store_true')
+    sweep.set_defaults(func=_run_sweep)
+    service = commands.add_parser('serve', help="Run a local HTTP (or Unix socket) dithering service with warm kernels and a bounded job queue.")
+    service.add_argument('--host', default="127.0.0.1")
+    service.add_argument('--port', type=int, default=8765)
+    service.add_argument('--socket', default=None, help="Listen on this Unix domain socket instead of TCP.")
+    service.add_argument('--workers', type=int, default=None, help="Dithering threads (default: CPU count).")
+    service.add_argument('--queue-size', type=int, default=64, help="Jobs allowed to wait; further requests get 503.")
+    service.add_argument('--max-batch', type=int, default=8, help="Queued jobs a worker takes at once.")
+    service.add_argument('--cache-mb', type=float, default=0, help="Keep recent results in memory, keyed by image and parameters.")
+    service.add_argument('--no-warmup', action='store_true', help="Skip compiling the kernels before accepting requests.")
+    service.add_argument('--quiet', action='store_true', help="Do not log each request.")
+    service.set_defaults(func=_run_serve)
+    warmup = commands.add_parser('warmup', help="Compile every kernel into Numba's on-disk cache and report first-call vs. repeat timings.")
+    warmup.add_argument('--algorithm', action='append', choices=list(DitherAlgorithms.ALGORITHMS), help="Limit to this algorithm (repeatable).")
+    warmup.set_defaults(func=_run_warmup)
+    bench = commands.add_parser('benchmark', help="Time every kernel on fixed-seed synthetic images, one fresh process per case.")
+    bench.add_argument('--algorithm', action='append', choices=list(DitherAlgorithms.ALGORITHMS), help="Limit to this algorithm (repeatable).")
+    bench.add_argument('--megapixels', type=float, nargs='+', default=list(DEFAULT_MEGAPIXELS))
+    bench.add_argument('--colors', type=int, nargs='+', default=list(DEFAULT_COLORS))
+    bench.add_argument('--strengths', type=int, nargs='+', default=list(DEFAULT_STRENGTHS))
+    bench.add_argument('--repeats', type=int, default=3, help="Warm runs per case; the median is reported.")
+    bench.add_argument('--precision', default="float64", choices=PRECISIONS)
+    bench.add_argument('--parallel', default="auto", choices=["auto", "on", "off"])
+    bench.add_argument('--output', default=None, help="Write the JSON report here.")
+    bench.add_argument('--baseline', default=None, help="JSON report to compare against; exits non-zero on regressions.")
+    bench.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Allowed MP/s drop before a case counts as a regression.")
+    bench.add_argument('--quiet', action='store_true')
+    bench.set_defaults(func=_run_benchmark)
+    args = parser.parse_args(argv)
+    if args.trace:
+        import instrumentation
+        instrumentation.enable(trace_memory=args.trace_memory)
+        try:
+            return args.func(args)
+        finally:
+            instrumentation.save_trace(args.trace)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
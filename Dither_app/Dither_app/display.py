@@ -0,0 +1,76 @@
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage, QPixmap
+import instrumentation
+
+QIMAGE_FORMATS = {'L': QImage.Format_Grayscale8, 'P': QImage.Format_Indexed8, 'RGB': QImage.Format_RGB888, 'RGBA': QImage.Format_RGBA8888}
+
+def image_buffer(image: Image.Image) -> np.ndarray:
+    # The uint8 array the dithering kernels produced this image from when it is still attached, otherwise one copy out of PIL.
+    array = getattr(image, 'source_array', None)
+    if array is None or array.dtype != np.uint8 or array.shape[:2] != (image.height, image.width) or array.ndim != (2 if image.mode in ('L', 'P') else 3):
+        array = np.asarray(image)
+    return np.ascontiguousarray(array)
+
+def to_qimage(image: Image.Image) -> tuple:
+    # Returns (QImage, buffer). The QImage borrows the buffer's memory rather than copying it, so the caller must keep
+    # the buffer referenced for as long as the QImage, or any QPixmap that may share its data, is alive.
+    if image.mode not in QIMAGE_FORMATS: image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = image_buffer(image)
+    qimage = QImage(buffer.data, image.width, image.height, buffer.strides[0], QIMAGE_FORMATS[image.mode])
+    if image.mode == 'P':
+        colors = np.array(image.getpalette() or [0, 0, 0], dtype=np.uint32).reshape(-1, 3)[:256]
+        qimage.setColorTable((0xFF000000 | colors[:, 0] << 16 | colors[:, 1] << 8 | colors[:, 2]).tolist())
+    return qimage, buffer
+
+class DisplayPyramid:
+    # Power-of-two box reductions of one image, each turned into a QPixmap only when first needed. A label is filled by
+    # smooth-scaling the smallest level that is still at least as large as the label, and the last result is kept.
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self._levels = {1: image}
+        self._pixmaps = {}
+        self._buffers = {}
+        self._scaled = (None, None)
+
+    def _level(self, factor: int) -> Image.Image:
+        if factor not in self._levels:
+            with instrumentation.span("pyramid", factor=factor):
+                # Reduce from the next finer level; "P" images are expanded to RGB once, for the first reduction only.
+                finer = self._level(factor // 2)
+                self._levels[factor] = (finer.convert('RGB') if finer.mode not in ('RGB', 'L') else finer).reduce(2)
+        return self._levels[factor]
+
+    def _factor_for(self, width: int, height: int) -> int:
+        factor = 1
+        while self.image.width // (factor * 2) >= width and self.image.height // (factor * 2) >= height: factor *= 2
+        return factor
+
+    def pixmap(self, width: int, height: int) -> QPixmap:
+        if self._scaled[0] == (width, height): return self._scaled[1]
+        scale = min(width / self.image.width, height / self.image.height)
+        factor = self._factor_for(max(1, int(self.image.width * scale)), max(1, int(self.image.height * scale)))
+        if factor not in self._pixmaps:
+            level = self._level(factor)
+            with instrumentation.span("qimage", factor=factor):
+                qimage, self._buffers[factor] = to_qimage(level); self._pixmaps[factor] = QPixmap.fromImage(qimage)
+        with instrumentation.span("scale"):
+            scaled = self._pixmaps[factor].scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self._scaled = ((width, height), scaled)
+        return scaled
+
+class DisplayCache:
+    # One pyramid per display slot, rebuilt only when a different image object is shown there.
+    def __init__(self):
+        self._pyramids = {}
+
+    def pixmap(self, slot: str, image: Image.Image, width: int, height: int) -> QPixmap:
+        pyramid = self._pyramids.get(slot)
+        if pyramid is None or pyramid.image is not image:
+            pyramid = self._pyramids[slot] = DisplayPyramid(image)
+        return pyramid.pixmap(width, height)
+
+    def clear(self, slot: str = None):
+        if slot is None: self._pyramids.clear()
+        else: self._pyramids.pop(slot, None)
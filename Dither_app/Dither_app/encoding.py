@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+from PIL import Image
+
+PACKED_EXTENSIONS = ('.bin',)
+BIT_LAYOUTS = ("packed", "planar")
+
+def bits_for(colors: int) -> int:
+    # Smallest PNG/packed depth that holds this many palette indices.
+    for bits in (1, 2, 4):
+        if colors <= 1 << bits: return bits
+    return 8
+
+def index_plane(image: Image.Image) -> tuple:
+    # (uint8 indices (h, w), uint8 palette (n, 3)) for a "P" result, or for an image with at most 256 distinct colors.
+    if image.mode == 'P':
+        indices = getattr(image, 'source_array', None)
+        if indices is None or indices.shape != (image.height, image.width) or indices.dtype != np.uint8: indices = np.asarray(image)
+        palette = np.array(image.getpalette() or [0, 0, 0], dtype=np.uint8).reshape(-1, 3)
+        return indices, palette[:int(indices.max()) + 1]
+    if image.mode != 'RGB': image = image.convert('RGB')
+    colors = image.getcolors(256)
+    if colors is None: raise ValueError("Image has more than 256 colors and cannot be stored as palette indices.")
+    return rgb_indices(image, colors)
+
+def rgb_indices(image: Image.Image, colors: list) -> tuple:
+    # Index plane of an RGB image whose colors getcolors() already listed: each pixel packs into one uint32 key that is
+    # looked up among the few sorted palette keys, instead of sorting every pixel's RGB triple.
+    rgb = getattr(image, 'source_array', None)
+    if rgb is None or rgb.shape != (image.height, image.width, 3): rgb = np.asarray(image)
+    keys = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]
+    palette = np.array(sorted(color for _, color in colors), dtype=np.uint8).reshape(-1, 3)
+    palette_keys = (palette[:, 0].astype(np.uint32) << 16) | (palette[:, 1].astype(np.uint32) << 8) | palette[:, 2]
+    return np.searchsorted(palette_keys, keys).astype(np.uint8), palette
+
+def pack_indices(indices: np.ndarray, bits: int) -> np.ndarray:
+    # Chunky layout: each row packs 8 // bits pixels per byte, leftmost pixel in the high bits, rows padded to whole bytes.
+    if bits == 8: return np.ascontiguousarray(indices, dtype=np.uint8)
+    height, width = indices.shape; per_byte = 8 // bits
+    padded = np.zeros((height, -(-width // per_byte) * per_byte), dtype=np.uint8); padded[:, :width] = indices
+    groups = padded.reshape(height, -1, per_byte)
+    packed = np.zeros(groups.shape[:2], dtype=np.uint8)
+    for k in range(per_byte): packed |= groups[:, :, k] << (8 - bits * (k + 1))
+    return packed
+
+def pack_bitplanes(indices: np.ndarray, bits: int) -> np.ndarray:
+    # Planar layout, shape (bits, h, ceil(w / 8)): plane k holds bit k (least significant first) of every index, 1 bit
+    # per pixel, leftmost pixel in the high bit, rows padded to whole bytes.
+    return np.stack([np.packbits((indices >> k) & 1, axis=1) for k in range(bits)])
+
+def save_packed(image: Image.Image, path: str, layout: str = "packed", bits: int = None) -> dict:
+    # Headerless bytes for display controllers, plus a JSON sidecar describing the geometry and palette order.
+    if layout not in BIT_LAYOUTS: raise ValueError(f"Unknown bit layout '{layout}', expected one of {BIT_LAYOUTS}.")
+    indices, palette = index_plane(image)
+    bits = bits or bits_for(len(palette))
+    if len(palette) > 1 << bits: raise ValueError(f"{len(palette)} colors do not fit in {bits} bits.")
+    data = pack_indices(indices, bits) if layout == "packed" else pack_bitplanes(indices, bits)
+    data.tofile(path)
+    info = {'width': image.width, 'height': image.height, 'bits': bits, 'layout': layout, 'row_bytes': data.shape[-1], 'bytes': data.nbytes, 'palette': palette.tolist()}
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f: json.dump(info, f)
+    return info
+
+def save_result(image: Image.Image, path: str, layout: str = "packed"):
+    # Indexed results go to PNG at 1/2/4/8 bits per pixel (PIL picks the depth from the palette length), to packed raw
+    # bytes for .bin, and are expanded to RGB only for formats without palettes.
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PACKED_EXTENSIONS: return save_packed(image, path, layout)
+    if image.mode == 'P' and extension in ('.jpg', '.jpeg'): image = image.convert('RGB')
+    elif image.mode == 'RGB' and extension == '.png' and (colors := image.getcolors(256)) is not None:
+        indices, palette = rgb_indices(image, colors)
+        image = Image.frombytes('P', image.size, indices.tobytes()); image.putpalette(palette.tobytes())
+    image.save(path)
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+def write_atomic(path: str, write):
+    # write(f) fills a binary file that then replaces path in one step. Each writer gets its own temp file in the target
+    # folder, so threads or processes producing the same path never share one. Callers only write content determined by
+    # the path, so losing the final rename to a file that is already in place still counts as written.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f: write(f)
+        os.replace(temp_path, path)
+    except OSError:
+        if not os.path.exists(path): raise
+    finally:
+        if os.path.exists(temp_path): os.remove(temp_path)
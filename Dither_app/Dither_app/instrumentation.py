@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+logger = logging.getLogger("dither.trace")
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.thread = threading.current_thread().name
+        self.start = self.seconds = 0.0
+        self.peak_bytes = None
+        self._peak_seen = self._base_bytes = 0
+
+    def __enter__(self):
+        stack = _stack()
+        if _tracer.trace_memory and tracemalloc.is_tracing():
+            # tracemalloc has one global peak: fold it into the enclosing span before resetting it for this one.
+            if stack: stack[-1]._peak_seen = max(stack[-1]._peak_seen, tracemalloc.get_traced_memory()[1])
+            self._base_bytes = tracemalloc.get_traced_memory()[0]; tracemalloc.reset_peak()
+        stack.append(self); self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        stack = _stack(); stack.pop()
+        if _tracer.trace_memory and tracemalloc.is_tracing():
+            self._peak_seen = max(self._peak_seen, tracemalloc.get_traced_memory()[1])
+            self.peak_bytes = self._peak_seen - self._base_bytes
+            if stack: stack[-1]._peak_seen = max(stack[-1]._peak_seen, self._peak_seen)
+        if stack: stack[-1].children.append(self)
+        else: _tracer.record(self)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        span = {'name': self.name, 'seconds': self.seconds, 'thread': self.thread, 'start': self.start}
+        if self.attrs: span['attrs'] = self.attrs
+        if self.peak_bytes is not None: span['peak_bytes'] = self.peak_bytes
+        if self.children: span['children'] = [child.to_dict() for child in self.children]
+        return span
+
+    def breakdown(self) -> dict:
+        # Total seconds per stage name over every descendant, in first-seen order.
+        totals = defaultdict(float)
+        def walk(span):
+            for child in span.children: totals[child.name] += child.seconds; walk(child)
+        walk(self)
+        return dict(totals)
+
+    def summary(self) -> str:
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.breakdown().items()]
+        if self.peak_bytes is not None: parts.append(f"peak {self.peak_bytes / 1e6:.1f} MB")
+        return f"{self.name} {self.seconds * 1000:.0f}ms: " + ", ".join(parts)
+
+class _NullSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def set(self, **attrs): pass
+
+_NULL_SPAN = _NullSpan()
+_local = threading.local()
+
+def _stack() -> list:
+    if not hasattr(_local, 'stack'): _local.stack = []
+    return _local.stack
+
+class Tracer:
+    # Collects finished root spans (as dicts, with their nested children) and named counters; thread-safe.
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.spans = []
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        span_dict = span.to_dict()
+        with self._lock: self.spans.append(span_dict)
+        if logger.isEnabledFor(logging.DEBUG): logger.debug(json.dumps(span_dict))
+
+    def count(self, name: str, value=1):
+        with self._lock: self.counters[name] += value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'spans': list(self.spans), 'counters': dict(self.counters)}
+
+    def merge(self, other: dict):
+        with self._lock:
+            self.spans.extend(other['spans'])
+            for name, value in other['counters'].items(): self.counters[name] += value
+
+    def clear(self):
+        with self._lock: self.spans.clear(); self.counters.clear()
+
+_tracer = Tracer()
+
+def enable(trace_memory: bool = False):
+    _tracer.enabled = True; _tracer.trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing(): tracemalloc.start()
+
+def disable():
+    _tracer.enabled = False
+    if _tracer.trace_memory and tracemalloc.is_tracing(): tracemalloc.stop()
+    _tracer.trace_memory = False
+
+def enabled() -> bool:
+    return _tracer.enabled
+
+def memory_tracing() -> bool:
+    return _tracer.trace_memory
+
+def span(name: str, **attrs):
+    return Span(name, attrs) if _tracer.enabled else _NULL_SPAN
+
+def count(name: str, value=1):
+    if _tracer.enabled: _tracer.count(name, value)
+
+def trace() -> dict:
+    return _tracer.to_dict()
+
+def merge(other: dict):
+    # Folds in a trace() collected elsewhere, e.g. returned by a worker process.
+    if _tracer.enabled: _tracer.merge(other)
+
+def clear():
+    _tracer.clear()
+
+def save_trace(path: str):
+    with open(path, 'w') as f: json.dump(trace(), f, indent=2)
+
+def configure_from_environment():
+    # DITHER_TRACE=1 turns tracing on; any other non-empty value is also a path the JSON trace is written to at exit.
+    # DITHER_TRACE_MEMORY=1 adds tracemalloc peak-allocation tracking, which slows allocation-heavy stages down.
+    target = os.environ.get("DITHER_TRACE")
+    if not target or target == "0": return
+    enable(trace_memory=os.environ.get("DITHER_TRACE_MEMORY") == "1")
+    if target != "1": atexit.register(save_trace, target)
+
+configure_from_environment()
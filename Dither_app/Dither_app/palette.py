@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import numba
+from PIL import Image
+
+HISTOGRAM_BITS = 5
+HISTOGRAM_MAX_PIXELS = 1_000_000
+KMEANS_ITERATIONS = 24
+KMEANS_TOLERANCE = 0.25
+KMEANS_SEED = 0
+PALETTE_METHODS = ("kmeans", "median_cut", "quantize")
+DEFAULT_PALETTE_METHOD = "kmeans"
+PALETTE_CACHE_ENTRIES = 64
+# Held around every parallel=True kernel call: Numba's workqueue threading layer, the one used when neither TBB nor
+# OpenMP is installed, aborts the process if two threads enter parallel code at once. Such kernels use every core anyway.
+PARALLEL_KERNEL_LOCK = threading.Lock()
+# Numba starts its threading layer on first use, and when that happens off the main thread (the GUI warm-up, a worker
+# thread) the TBB and OpenMP layers keep the interpreter from exiting. Every entry point imports this module on the
+# main thread, so start the layer now.
+numba.get_num_threads()
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_color_histogram(img_array, step):
+    # Counts and channel sums per 5-bit RGB cell over every step-th pixel of every step-th row; the sums give each
+    # occupied cell its exact mean color rather than the cell center.
+    cells = 1 << HISTOGRAM_BITS; shift = 8 - HISTOGRAM_BITS
+    counts = np.zeros(cells**3, dtype=np.int64); sums = np.zeros((cells**3, 3), dtype=np.int64)
+    for y in range(0, img_array.shape[0], step):
+        for x in range(0, img_array.shape[1], step):
+            r = img_array[y, x, 0]; g = img_array[y, x, 1]; b = img_array[y, x, 2]
+            cell = ((r >> shift) * cells + (g >> shift)) * cells + (b >> shift)
+            counts[cell] += 1; sums[cell, 0] += r; sums[cell, 1] += g; sums[cell, 2] += b
+    return counts, sums
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_kmeans_plus_plus(points, weights, k, seed):
+    # Weighted k-means++ seeding: each new center is drawn with probability proportional to weight * squared distance.
+    np.random.seed(seed)
+    n = points.shape[0]; centers = np.empty((k, 3)); nearest = np.full(n, np.inf)
+    cumulative = np.cumsum(weights); first = np.searchsorted(cumulative, np.random.random() * cumulative[-1])
+    centers[0] = points[min(first, n - 1)]
+    for c in range(1, k):
+        total = 0.0
+        for i in range(n):
+            d = (points[i, 0] - centers[c - 1, 0])**2 + (points[i, 1] - centers[c - 1, 1])**2 + (points[i, 2] - centers[c - 1, 2])**2
+            if d < nearest[i]: nearest[i] = d
+            total += weights[i] * nearest[i]
+        target = np.random.random() * total; chosen = n - 1; running = 0.0
+        for i in range(n):
+            running += weights[i] * nearest[i]
+            if running >= target and nearest[i] > 0.0: chosen = i; break
+        centers[c] = points[chosen]
+    return centers
+
+@numba.jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _jit_assign(points, centers, labels):
+    for i in numba.prange(points.shape[0]):
+        best = np.inf; best_index = 0
+        for c in range(centers.shape[0]):
+            d = (points[i, 0] - centers[c, 0])**2 + (points[i, 1] - centers[c, 1])**2 + (points[i, 2] - centers[c, 2])**2
+            if d < best: best = d; best_index = c
+        labels[i] = best_index
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _jit_update_centers(points, weights, labels, centers):
+    # Weighted means per cluster; an empty cluster keeps its previous center. Returns the largest center movement.
+    k = centers.shape[0]; sums = np.zeros((k, 3)); totals = np.zeros(k); moved = 0.0
+    for i in range(points.shape[0]):
+        c = labels[i]; totals[c] += weights[i]
+        for ch in range(3): sums[c, ch] += points[i, ch] * weights[i]
+    for c in range(k):
+        if totals[c] == 0.0: continue
+        d = 0.0
+        for ch in range(3):
+            value = sums[c, ch] / totals[c]; d += (value - centers[c, ch])**2; centers[c, ch] = value
+        moved = max(moved, d)
+    return np.sqrt(moved)
+
+def color_histogram(image: Image.Image, max_pixels: int = HISTOGRAM_MAX_PIXELS) -> tuple:
+    # Distinct 5-bit cells of a subsample of the image as (mean colors float64 (n, 3), pixel counts float64 (n,)).
+    step = max(1, int(np.ceil(np.sqrt(image.width * image.height / max_pixels))))
+    # Nearest-neighbour resampling picks the same pixels as striding but without first copying the whole image out.
+    if step > 1: image = image.resize((max(1, image.width // step), max(1, image.height // step)), Image.NEAREST)
+    counts, sums = _jit_color_histogram(np.asarray(image if image.mode == 'RGB' else image.convert('RGB')), 1)
+    occupied = np.nonzero(counts)[0]
+    return sums[occupied] / counts[occupied, None], counts[occupied].astype(np.float64)
+
+def median_cut(points: np.ndarray, weights: np.ndarray, num_colors: int) -> np.ndarray:
+    # Repeatedly splits the box with the largest weighted channel range at its weighted median; returns box means.
+    def score(box):
+        return np.ptp(points[box], axis=0).max() * weights[box].sum() if len(box) > 1 else -1.0
+    boxes = [np.arange(len(points))]; scores = [score(boxes[0])]
+    while len(boxes) < num_colors:
+        widest = int(np.argmax(scores))
+        if scores[widest] <= 0: break
+        box = boxes.pop(widest); scores.pop(widest); channel = int(np.argmax(np.ptp(points[box], axis=0)))
+        box = box[np.argsort(points[box, channel], kind='stable')]
+        split = int(np.searchsorted(np.cumsum(weights[box]), weights[box].sum() / 2.0))
+        split = min(max(split, 1), len(box) - 1)
+        for half in (box[:split], box[split:]): boxes.append(half); scores.append(score(half))
+    return np.array([np.average(points[box], axis=0, weights=weights[box]) for box in boxes])
+
+def kmeans(points: np.ndarray, weights: np.ndarray, num_colors: int, iterations: int = KMEANS_ITERATIONS, seed: int = KMEANS_SEED) -> np.ndarray:
+    centers = _jit_kmeans_plus_plus(points, weights, num_colors, seed)
+    labels = np.empty(len(points), dtype=np.int64)
+    for _ in range(iterations):
+        with PARALLEL_KERNEL_LOCK: _jit_assign(points, centers, labels)
+        if _jit_update_centers(points, weights, labels, centers) < KMEANS_TOLERANCE: break
+    return centers
+
+def _finish(centers: np.ndarray, num_colors: int) -> list:
+    # Rounds, drops duplicates and orders darkest first so equal inputs always give identical palettes.
+    colors = np.unique(np.clip(np.rint(centers), 0, 255).astype(np.int64), axis=0)[:num_colors]
+    colors = colors[np.argsort(colors @ np.array([299, 587, 114]), kind='stable')]
+    return colors.tolist()
+
+def extract_palette(image: Image.Image, num_colors: int, method: str = DEFAULT_PALETTE_METHOD) -> list:
+    if method not in PALETTE_METHODS: raise ValueError(f"Unknown palette method '{method}', expected one of {PALETTE_METHODS}.")
+    if method == "quantize":
+        quant_img = image.quantize(colors=num_colors); palette = quant_img.getpalette()
+        return [palette[3 * index:3 * index + 3] for _, index in sorted(quant_img.getcolors(256), key=lambda entry: entry[1])]
+    points, weights = color_histogram(image)
+    if len(points) <= num_colors: return _finish(points, num_colors)
+    return _finish(median_cut(points, weights, num_colors) if method == "median_cut" else kmeans(points, weights, num_colors), num_colors)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def cached_palette(image: Image.Image, num_colors: int, method: str = DEFAULT_PALETTE_METHOD, digest: str = None) -> list:
+    # Palettes keyed by image digest; without a digest the palette is simply computed.
+    if digest is None: return extract_palette(image, num_colors, method)
+    key = (digest, num_colors, method)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key); return _cache[key]
+    palette = extract_palette(image, num_colors, method)
+    with _cache_lock:
+        _cache[key] = palette
+        while len(_cache) > PALETTE_CACHE_ENTRIES: _cache.popitem(last=False)
+    return palette
@@ -0,0 +1,113 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageSequence
+from algorithms import DitherAlgorithms
+from batch import IMAGE_EXTENSIONS
+from palette import DEFAULT_PALETTE_METHOD
+import instrumentation
+
+DEFAULT_QUEUE_FRAMES = 8
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_SIZE = 256
+DEFAULT_FRAME_DURATION = 100
+STABLE_SEED = 0
+ANIMATED_EXTENSIONS = ('.gif', '.png', '.apng', '.webp')
+
+class FrameSource:
+    # Frames of an animated GIF/APNG/WebP, or every image in a directory in name order, decoded lazily as RGB.
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+            self.frame_count = len(self.files); self.loop = 0
+        else:
+            self.files = None
+            with Image.open(path) as image:
+                self.frame_count = getattr(image, 'n_frames', 1); self.loop = image.info.get('loop', 0)
+        if not self.frame_count: raise ValueError(f"No frames found in '{path}'.")
+
+    def frames(self, indices=None):
+        # Yields (index, RGB image, duration in ms).
+        wanted = set(range(self.frame_count) if indices is None else indices)
+        if self.files is not None:
+            for index in sorted(wanted):
+                with Image.open(self.files[index]) as image:
+                    yield index, image.convert('RGB'), image.info.get('duration', DEFAULT_FRAME_DURATION)
+            return
+        with Image.open(self.path) as image:
+            for index, frame in enumerate(ImageSequence.Iterator(image)):
+                if index in wanted: yield index, frame.convert('RGB'), frame.info.get('duration', DEFAULT_FRAME_DURATION)
+
+    def palette(self, palette_name: str, num_colors: int, method: str = DEFAULT_PALETTE_METHOD) -> list:
+        # One palette for the whole clip, quantized from a montage of evenly spaced, downscaled frames.
+        if palette_name != "Auto (From Image)": return DitherAlgorithms.build_palette(None, palette_name, num_colors)
+        step = max(1, self.frame_count // PALETTE_SAMPLE_FRAMES)
+        thumbnails = []
+        for _, frame, _ in self.frames(range(0, self.frame_count, step)):
+            frame.thumbnail((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE)); thumbnails.append(frame)
+        montage = Image.new('RGB', (sum(t.width for t in thumbnails), max(t.height for t in thumbnails)))
+        x = 0
+        for thumbnail in thumbnails: montage.paste(thumbnail, (x, 0)); x += thumbnail.width
+        return DitherAlgorithms.build_palette(montage, palette_name, num_colors, method)
+
+class FrameWriter:
+    # A directory receives one PNG per frame as soon as it is encoded. Animated containers are assembled by PIL on close,
+    # so every dithered frame of a .gif/.apng/.webp output is held in memory until then.
+    def __init__(self, path: str, loop: int = 0):
+        self.path = path; self.loop = loop
+        self.directory = not os.path.splitext(path)[1]
+        if self.directory: os.makedirs(path, exist_ok=True)
+        elif not path.lower().endswith(ANIMATED_EXTENSIONS): raise ValueError(f"Sequence output must be a directory or one of {ANIMATED_EXTENSIONS}.")
+        self.frames, self.durations = [], []
+
+    def write(self, index: int, frame: Image.Image, duration: int):
+        if self.directory: frame.save(os.path.join(self.path, f"frame_{index:05d}.png"))
+        else: self.frames.append(frame); self.durations.append(duration)
+
+    def close(self):
+        if self.directory or not self.frames: return
+        extra = {'lossless': True} if self.path.lower().endswith('.webp') else {}
+        self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:], duration=self.durations, loop=self.loop, **extra)
+
+def dither_sequence(src_path: str, dst_path: str, dither_params: dict, workers: int = None, queue_frames: int = DEFAULT_QUEUE_FRAMES, stable: bool = False, progress=None) -> dict:
+    # Decode thread -> bounded queue of in-flight dither futures -> encoder (this thread), which consumes them in frame order.
+    # The queue bound caps decoded-but-undithered frames. With directory output, memory stays flat however long the
+    # clip is; animated outputs also keep every dithered frame until FrameWriter.close() encodes the file.
+    source = FrameSource(src_path)
+    with instrumentation.span("palette"): palette_rgb = source.palette(dither_params['palette_name'], dither_params['num_colors'], dither_params.get('palette_method', DEFAULT_PALETTE_METHOD))
+    workers = workers or os.cpu_count() or 1
+    options = {'precision': dither_params.get('precision', "float64"), 'block_size': dither_params.get('block_size', 1)}
+    if workers > 1: options['parallel'] = False
+    if stable and DitherAlgorithms.ALGORITHMS[dither_params['algorithm_name']] == "random": options['seed'] = STABLE_SEED
+    pending = queue.Queue(maxsize=queue_frames); failure = []
+
+    def dither_frame(frame):
+        with instrumentation.span("frame"):
+            return DitherAlgorithms.apply(dither_params['algorithm_name'], frame, palette_rgb, dither_params['dither_strength'] / 100.0, **options)
+
+    def decode(pool):
+        try:
+            for index, frame, duration in source.frames():
+                pending.put((index, duration, pool.submit(dither_frame, frame)))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            pending.put(None)
+
+    writer = FrameWriter(dst_path, source.loop); written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        decoder = threading.Thread(target=decode, args=(pool,), name="sequence-decode", daemon=True); decoder.start()
+        try:
+            while (item := pending.get()) is not None:
+                index, duration, future = item
+                with instrumentation.span("encode"): writer.write(index, future.result(), duration)
+                written += 1
+                if progress: progress(written, source.frame_count)
+        finally:
+            while item is not None: item = pending.get()
+            decoder.join()
+    if failure: raise failure[0]
+    writer.close()
+    return {'frames': written, 'palette': palette_rgb}
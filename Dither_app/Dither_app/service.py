@@ -0,0 +1,218 @@
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from PIL import Image
+from algorithms import DitherAlgorithms, DitherCancelled, PRECISIONS, warm_up_kernels
+from cache import ResultCache
+from palette import DEFAULT_PALETTE_METHOD, PALETTE_METHODS
+import instrumentation
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_MAX_BATCH = 8
+DEFAULT_REQUEST_TIMEOUT = 300.0
+MAX_BODY_BYTES = 256 * 1024 * 1024
+LATENCY_WINDOW = 2048
+OUTPUT_FORMATS = {'png': ('PNG', 'image/png'), 'bmp': ('BMP', 'image/bmp'), 'tiff': ('TIFF', 'image/tiff'), 'webp': ('WEBP', 'image/webp')}
+
+class ServiceBusy(Exception):
+    pass
+
+class DitherService:
+    # Worker threads fed from one bounded queue. Each worker takes whatever is waiting (up to max_batch jobs) in one go,
+    # so bursts of small requests share a single wake-up and the palettes they have in common are built once per batch.
+    # A full queue rejects new work instead of letting latency grow without bound.
+    def __init__(self, workers: int = None, queue_size: int = DEFAULT_QUEUE_SIZE, max_batch: int = DEFAULT_MAX_BATCH, cache: ResultCache = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.cache = cache
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self.submitted = self.completed = self.failed = self.rejected = self.batches = self.batched_jobs = self.pixels = 0
+        # With several workers each image is dithered on one thread; a lone worker may still split large images.
+        self.options = {'parallel': False} if self.workers > 1 else {}
+
+    def start(self, warm_up: bool = True):
+        if warm_up:
+            with instrumentation.span("warmup"): warm_up_kernels()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"dither-service-{i}", daemon=True); thread.start(); self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for _ in self._threads: self._queue.put(None)
+        for thread in self._threads: thread.join()
+        self._threads.clear()
+
+    def submit(self, image: Image.Image, dither_params: dict) -> Future:
+        future = Future()
+        try:
+            self._queue.put_nowait((image, dither_params, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock: self.rejected += 1
+            raise ServiceBusy(f"Queue is full ({self._queue.maxsize} jobs waiting).")
+        with self._lock: self.submitted += 1
+        return future
+
+    def dither(self, image: Image.Image, dither_params: dict, timeout: float = DEFAULT_REQUEST_TIMEOUT) -> Image.Image:
+        return self.submit(image, dither_params).result(timeout)
+
+    def _run(self):
+        while (job := self._queue.get()) is not None:
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try: job = self._queue.get_nowait()
+                except queue.Empty: break
+                if job is None: self._queue.put(None); break
+                batch.append(job)
+            with self._lock: self.batches += 1; self.batched_jobs += len(batch)
+            with instrumentation.span("batch", jobs=len(batch)): self._process(batch)
+
+    def _process(self, batch: list):
+        palettes = {}
+        for image, params, future, queued in batch:
+            if not future.set_running_or_notify_cancel(): continue
+            try:
+                with instrumentation.span("job", algorithm=params['algorithm_name']):
+                    result = self._dither(image, params, palettes)
+            except Exception as e:
+                with self._lock: self.failed += 1
+                future.set_exception(e); continue
+            with self._lock:
+                self.completed += 1; self.pixels += image.width * image.height; self._latencies.append(time.perf_counter() - queued)
+            future.set_result(result)
+
+    def _dither(self, image: Image.Image, params: dict, palettes: dict) -> Image.Image:
+        image = image.convert('RGB'); method = params.get('palette_method', DEFAULT_PALETTE_METHOD)
+        digest = ResultCache.image_digest(image) if self.cache is not None or params['palette_name'] == "Auto (From Image)" else None
+        cache_key = ResultCache.make_key(digest, params) if self.cache is not None else None
+        if cache_key and (hit := self.cache.get(cache_key)) is not None: return hit[0]
+        # Fixed palettes are shared by the whole batch; auto palettes additionally hit the digest-keyed palette cache.
+        palette_key = (params['palette_name'], params['num_colors'], method, digest if params['palette_name'] == "Auto (From Image)" else None)
+        if palette_key not in palettes:
+            with instrumentation.span("palette", palette=params['palette_name']): palettes[palette_key] = DitherAlgorithms.build_palette(image, params['palette_name'], params['num_colors'], method, digest)
+        result = DitherAlgorithms.apply(params['algorithm_name'], image, palettes[palette_key], params['dither_strength'] / 100.0, precision=params.get('precision', "float64"), block_size=params.get('block_size', 1), **self.options)
+        if cache_key: self.cache.put(cache_key, result, palettes[palette_key])
+        return result
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            metrics = {'uptime_seconds': time.time() - self.started, 'workers': self.workers, 'queue_depth': self._queue.qsize(), 'queue_size': self._queue.maxsize,
+                       'submitted': self.submitted, 'completed': self.completed, 'failed': self.failed, 'rejected': self.rejected,
+                       'batches': self.batches, 'mean_batch_size': self.batched_jobs / self.batches if self.batches else 0.0, 'megapixels': self.pixels / 1e6}
+        metrics['megapixels_per_second'] = metrics['megapixels'] / metrics['uptime_seconds']
+        metrics['jobs_per_second'] = metrics['completed'] / metrics['uptime_seconds']
+        for p in (50, 95, 99): metrics[f'latency_p{p}_ms'] = float(np.percentile(latencies, p)) if len(latencies) else None
+        if self.cache is not None: metrics['cache'] = self.cache.stats()
+        return metrics
+
+def parse_params(query: dict) -> dict:
+    # Query string -> dither_params, with the same names and defaults as the CLI.
+    def get(name, default):
+        return query.get(name, [default])[0]
+    params = {'algorithm_name': get('algorithm', "Floyd-Steinberg"), 'palette_name': get('palette', "Auto (From Image)"), 'num_colors': int(get('colors', 8)),
+              'dither_strength': int(get('strength', 100)), 'precision': get('precision', "float64"), 'palette_method': get('palette_method', DEFAULT_PALETTE_METHOD),
+              'block_size': int(get('block_size', 1))}
+    if params['algorithm_name'] not in DitherAlgorithms.ALGORITHMS: raise ValueError(f"Unknown algorithm '{params['algorithm_name']}'.")
+    if params['palette_name'] not in DitherAlgorithms.DYNAMIC_PALETTES and params['palette_name'] not in DitherAlgorithms.PREDEFINED_PALETTES: raise ValueError(f"Unknown palette '{params['palette_name']}'.")
+    if not 2 <= params['num_colors'] <= 256: raise ValueError("colors must be between 2 and 256.")
+    if not 0 <= params['dither_strength'] <= 100: raise ValueError("strength must be between 0 and 100.")
+    if params['precision'] not in PRECISIONS: raise ValueError(f"precision must be one of {PRECISIONS}.")
+    if not 1 <= params['block_size'] <= 256: raise ValueError("block_size must be between 1 and 256.")
+    if params['palette_method'] not in PALETTE_METHODS: raise ValueError(f"palette_method must be one of {PALETTE_METHODS}.")
+    return params
+
+class DitherRequestHandler(BaseHTTPRequestHandler):
+    # POST /dither?algorithm=...&palette=...&colors=...&strength=...&format=png with the encoded image as the body.
+    # GET /metrics returns the service counters as JSON; GET /health answers 200 once the workers are running.
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, body: bytes, content_type: str = 'application/json', headers: dict = None):
+        self.send_response(status); self.send_header('Content-Type', content_type); self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers(); self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: dict = None):
+        self._reply(status, json.dumps({'error': message}).encode(), headers=headers)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if not self.server.quiet: super().log_message(format, *args)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics': self._reply(200, json.dumps(self.server.service.metrics()).encode())
+        elif path == '/health': self._reply(200, b'{"status": "ok"}')
+        else: self._error(404, f"No such endpoint '{path}'.")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/dither':
+            self.close_connection = True; self._error(404, f"No such endpoint '{url.path}'."); return
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= MAX_BODY_BYTES:
+            self.close_connection = True; self._error(413 if length else 411, "Send the image as the request body with a Content-Length."); return
+        body = self.rfile.read(length)
+        query = parse_qs(url.query)
+        try:
+            params = parse_params(query)
+            output_format, content_type = OUTPUT_FORMATS[query.get('format', ['png'])[0].lower()]
+            image = Image.open(io.BytesIO(body)); image.load()
+        except Image.DecompressionBombError as e:
+            self._error(413, str(e)); return
+        except (KeyError, ValueError, OSError) as e:
+            self._error(400, str(e) if not isinstance(e, KeyError) else f"format must be one of {tuple(OUTPUT_FORMATS)}."); return
+        try:
+            result = self.server.service.dither(image, params, self.server.request_timeout)
+        except ServiceBusy as e:
+            self._error(503, str(e), {'Retry-After': '1'}); return
+        except DitherCancelled:
+            self._error(503, "Cancelled."); return
+        except Exception as e:
+            self._error(500, f"{type(e).__name__}: {e}"); return
+        out = io.BytesIO()
+        (result if output_format in ('PNG', 'TIFF', 'BMP') else result.convert('RGB')).save(out, format=output_format, **({'lossless': True} if output_format == 'WEBP' else {}))
+        self._reply(200, out.getvalue(), content_type)
+
+class DitherHTTPServer(ThreadingHTTPServer):
+    def __init__(self, address, service: DitherService, request_timeout: float = DEFAULT_REQUEST_TIMEOUT, quiet: bool = False):
+        self.service = service; self.request_timeout = request_timeout; self.quiet = quiet
+        super().__init__(address, DitherRequestHandler)
+
+class DitherUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Same handler over a Unix domain socket; HTTPServer.server_bind assumes a (host, port) address, so it is not used.
+    daemon_threads = True
+
+    def __init__(self, path: str, service: DitherService, request_timeout: float = DEFAULT_REQUEST_TIMEOUT, quiet: bool = False):
+        self.service = service; self.request_timeout = request_timeout; self.quiet = quiet
+        if os.path.exists(path) and not os.path.isdir(path): os.unlink(path)
+        super().__init__(path, DitherRequestHandler)
+        self.server_name = socket.gethostname(); self.server_port = 0
+
+def make_server(service: DitherService, host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None, **options):
+    return DitherUnixServer(unix_socket, service, **options) if unix_socket else DitherHTTPServer((host, port), service, **options)
+
+def serve(host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None, workers: int = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+          max_batch: int = DEFAULT_MAX_BATCH, cache_bytes: int = 0, warm_up: bool = True, quiet: bool = False):
+    service = DitherService(workers, queue_size, max_batch, ResultCache(cache_bytes) if cache_bytes else None).start(warm_up)
+    server = make_server(service, host, port, unix_socket, quiet=quiet)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close(); service.stop()
+        if unix_socket and os.path.exists(unix_socket): os.unlink(unix_socket)
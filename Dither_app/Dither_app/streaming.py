@@ -0,0 +1,164 @@
+import os
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+from algorithms import DitherAlgorithms, BandDitherer
+from palette import DEFAULT_PALETTE_METHOD
+
+DEFAULT_BAND_ROWS = 256
+PALETTE_SAMPLE_PIXELS = 1_000_000
+
+class BandReader:
+    # Row-band access to .npy (memory-mapped), headerless .raw RGB (memory-mapped), uncompressed strip TIFF (each strip
+    # memory-mapped) or any other PIL-readable file. Other formats are decoded whole into uint8 RGB, so they are refused
+    # above PIL's decompression-bomb limit rather than streamed; only the dithering buffers are band-sized in that case.
+    def __init__(self, path: str, raw_size: tuple = None):
+        ext = os.path.splitext(path)[1].lower()
+        self.image = None; self.strips = None
+        if ext == '.npy':
+            self.array = np.load(path, mmap_mode='r')
+        elif ext == '.raw':
+            if raw_size is None: raise ValueError("Raw input needs an explicit (width, height).")
+            width, height = raw_size
+            self.array = np.memmap(path, dtype=np.uint8, mode='r', shape=(height, width, 3))
+        else:
+            self.array = None
+            # This explicit large-file path checks the size itself, after finding out whether the file can be mapped.
+            limit = Image.MAX_IMAGE_PIXELS; Image.MAX_IMAGE_PIXELS = None
+            try: image = Image.open(path)
+            finally: Image.MAX_IMAGE_PIXELS = limit
+            self.strips = BandReader._map_strips(path, image)
+            if self.strips is None:
+                if limit and image.width * image.height > limit:
+                    raise ValueError(f"{path} is {image.width}x{image.height} and would have to be decoded whole; convert it to "
+                                     "uncompressed TIFF, .npy or .raw to stream it.")
+                self.image = image.convert('RGB')
+            self.width, self.height = image.size
+        if self.array is not None and (self.array.dtype != np.uint8 or self.array.ndim not in (2, 3)):
+            raise ValueError(f"Expected a uint8 (height, width[, 3]) array, got {self.array.dtype} {self.array.shape}.")
+        if self.array is not None: self.width, self.height = self.array.shape[1], self.array.shape[0]
+
+    @staticmethod
+    def _map_strips(path: str, image: Image.Image):
+        # [(y_start, y_stop, memmap)] when every tile is a full-width run of packed 8-bit L/RGB/RGBA rows, else None.
+        channels = {'L': 1, 'RGB': 3, 'RGBA': 4}.get(image.mode)
+        if image.format != 'TIFF' or channels is None or not image.tile: return None
+        strips = []
+        for tile in image.tile:
+            x0, y0, x1, y1 = tile.extents
+            if tile.codec_name != 'raw' or tile.args[0] != image.mode or tile.args[1] not in (0, image.width * channels) or (x0, x1) != (0, image.width):
+                return None
+            strips.append((y0, y1, np.memmap(path, dtype=np.uint8, mode='r', offset=tile.offset, shape=(y1 - y0, image.width) + ((channels,) if channels > 1 else ()))))
+        return sorted(strips, key=lambda strip: strip[0])
+
+    def read_rows(self, y_start: int, y_stop: int) -> np.ndarray:
+        if self.image is not None:
+            return np.asarray(self.image.crop((0, y_start, self.width, y_stop)))
+        if self.strips is not None:
+            rows = np.concatenate([strip[max(0, y_start - y0):y_stop - y0] for y0, y1, strip in self.strips if y0 < y_stop and y1 > y_start])
+        else:
+            rows = np.asarray(self.array[y_start:y_stop])
+        return np.repeat(rows[:, :, None], 3, axis=2) if rows.ndim == 2 else rows[:, :, :3]
+
+    def sample(self, max_pixels: int = PALETTE_SAMPLE_PIXELS) -> Image.Image:
+        stride = max(1, int(np.ceil(np.sqrt(self.width * self.height / max_pixels))))
+        rows = [self.read_rows(y, y + 1)[:, ::stride] for y in range(0, self.height, stride)]
+        return Image.fromarray(np.ascontiguousarray(np.concatenate(rows)))
+
+class PngBandWriter:
+    def __init__(self, path: str, width: int, height: int):
+        self.file = open(path, 'wb'); self.width, self.height = width, height
+        self.compressor = zlib.compressobj(6)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, tag: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    def write(self, rows: np.ndarray):
+        scanlines = np.zeros((rows.shape[0], rows.shape[1] * 3 + 1), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data: self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush()); self._chunk(b'IEND', b''); self.file.close()
+
+class TiffBandWriter:
+    # Uncompressed strip TIFF; the IFD is written after the strips so each band can go straight to disk.
+    # Switches to BigTIFF when the pixel data would not fit classic TIFF's 32-bit offsets.
+    def __init__(self, path: str, width: int, height: int, rows_per_strip: int):
+        self.file = open(path, 'wb'); self.width, self.height, self.rows_per_strip = width, height, rows_per_strip
+        self.big = width * height * 3 > 0xffff0000
+        self.file.write(b'II' + (struct.pack('<HHHQ', 43, 8, 0, 0) if self.big else struct.pack('<HI', 42, 0)))
+        self.strip_offsets, self.strip_counts = [], []
+
+    def write(self, rows: np.ndarray):
+        self.strip_offsets.append(self.file.tell()); data = np.ascontiguousarray(rows).tobytes()
+        self.strip_counts.append(len(data)); self.file.write(data)
+
+    def close(self):
+        offset_type, offset_fmt = (16, 'Q') if self.big else (4, 'I')
+        if self.file.tell() % 2: self.file.write(b'\0')
+        extra = bytearray(); base = self.file.tell()
+        def out_of_line(values, fmt):
+            nonlocal extra
+            position = base + len(extra); extra += struct.pack('<' + fmt * len(values), *values)
+            if len(extra) % 2: extra += b'\0'
+            return position
+        entries = [(256, 4, [self.width]), (257, 4, [self.height]), (258, 3, [8, 8, 8]), (259, 3, [1]), (262, 3, [2]),
+                   (273, offset_type, self.strip_offsets), (277, 3, [3]), (278, 4, [self.rows_per_strip]),
+                   (279, offset_type, self.strip_counts), (284, 3, [1])]
+        formats = {3: 'H', 4: 'I', 16: 'Q'}; inline = 8 if self.big else 4
+        packed = []
+        for tag, kind, values in entries:
+            fmt = formats[kind]
+            if struct.calcsize('<' + fmt * len(values)) <= inline: field = struct.pack('<' + fmt * len(values), *values).ljust(inline, b'\0')
+            else: field = struct.pack('<' + offset_fmt, out_of_line(values, fmt))
+            packed.append(struct.pack('<HH' + ('Q' if self.big else 'I'), tag, kind, len(values)) + field)
+        self.file.write(bytes(extra)); ifd_offset = self.file.tell()
+        self.file.write(struct.pack('<Q' if self.big else '<H', len(packed)) + b''.join(packed) + struct.pack('<' + offset_fmt, 0))
+        self.file.seek(8 if self.big else 4); self.file.write(struct.pack('<' + offset_fmt, ifd_offset)); self.file.close()
+
+class NpyBandWriter:
+    def __init__(self, path: str, width: int, height: int):
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(height, width, 3)); self.row = 0
+
+    def write(self, rows: np.ndarray):
+        self.array[self.row:self.row + rows.shape[0]] = rows; self.row += rows.shape[0]
+
+    def close(self):
+        self.array.flush(); del self.array
+
+def open_band_writer(path: str, width: int, height: int, band_rows: int = DEFAULT_BAND_ROWS):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.png': return PngBandWriter(path, width, height)
+    if ext in ('.tif', '.tiff'): return TiffBandWriter(path, width, height, band_rows)
+    if ext == '.npy': return NpyBandWriter(path, width, height)
+    raise ValueError(f"Streaming output supports .png, .tif/.tiff and .npy, not '{ext}'.")
+
+def dither_file_streaming(src_path: str, dst_path: str, dither_params: dict, band_rows: int = DEFAULT_BAND_ROWS, raw_size: tuple = None, progress=None) -> dict:
+    reader = BandReader(src_path, raw_size)
+    palette_source = reader.sample() if dither_params['palette_name'] == "Auto (From Image)" else None
+    palette_rgb = DitherAlgorithms.build_palette(palette_source, dither_params['palette_name'], dither_params['num_colors'], dither_params.get('palette_method', DEFAULT_PALETTE_METHOD))
+    # In pixel-art mode each band covers whole blocks, is area-averaged to one row per block row, dithered at that size
+    # and enlarged again, so the error-diffusion ring continues across bands in block rows.
+    block = dither_params.get('block_size') or 1
+    band_rows = -(-band_rows // block) * block
+    ditherer = BandDitherer(dither_params['algorithm_name'], palette_rgb, dither_params['dither_strength'] / 100.0, -(-reader.width // block))
+    writer = open_band_writer(dst_path, reader.width, reader.height, band_rows)
+    try:
+        for y in range(0, reader.height, band_rows):
+            y_stop = min(reader.height, y + band_rows)
+            band = reader.read_rows(y, y_stop)
+            if block > 1:
+                band = ditherer(np.asarray(Image.fromarray(np.ascontiguousarray(band)).reduce(block)), y // block)
+                band = band.repeat(block, axis=0).repeat(block, axis=1)[:y_stop - y, :reader.width]
+            else:
+                band = ditherer(band, y)
+            writer.write(band)
+            if progress: progress(y_stop, reader.height)
+    finally:
+        writer.close()
+    return {'width': reader.width, 'height': reader.height, 'palette': palette_rgb}
@@ -0,0 +1,73 @@
+import itertools
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw
+from algorithms import DitherAlgorithms, reuse_work_buffers
+from palette import DEFAULT_PALETTE_METHOD
+import instrumentation
+
+DEFAULT_CELL_SIZE = (320, 240)
+LABEL_HEIGHT = 28
+
+def sweep_configs(algorithms, palettes, strengths, num_colors=(8,), precision="float64", palette_method=DEFAULT_PALETTE_METHOD, block_sizes=(1,)) -> list:
+    # Cartesian product as dither_params dicts; num_colors only multiplies the dynamic palettes.
+    configs = []
+    for algorithm_name, palette_name, strength, block_size in itertools.product(algorithms, palettes, strengths, block_sizes):
+        for colors in (num_colors if palette_name in DitherAlgorithms.DYNAMIC_PALETTES else num_colors[:1]):
+            configs.append({'algorithm_name': algorithm_name, 'palette_name': palette_name, 'num_colors': colors, 'dither_strength': strength,
+                            'precision': precision, 'palette_method': palette_method, 'block_size': block_size})
+    return configs
+
+def run_sweep(image: Image.Image, configs: list, workers: int = None, max_pixels: int = None, progress=None) -> list:
+    # The image is converted (and optionally downscaled) once, each distinct palette is built once, and palette indexes
+    # are shared through DitherAlgorithms' cache. Configurations run concurrently on threads (the kernels release the
+    # GIL), each thread reusing one float work buffer across its error-diffusion runs.
+    image = image.convert('RGB')
+    if max_pixels and image.width * image.height > max_pixels:
+        scale = (max_pixels / (image.width * image.height)) ** 0.5
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BOX)
+    palettes = {}
+    for params in configs:
+        key = (params['palette_name'], params['num_colors'], params.get('palette_method', DEFAULT_PALETTE_METHOD))
+        if key not in palettes:
+            with instrumentation.span("palette", palette=key[0]): palettes[key] = DitherAlgorithms.build_palette(image, *key)
+            DitherAlgorithms.palette_index(np.array(palettes[key], dtype=np.float64))
+    workers = workers or os.cpu_count() or 1
+    options = {'parallel': False} if workers > 1 else {}
+
+    def run(params):
+        palette = palettes[(params['palette_name'], params['num_colors'], params.get('palette_method', DEFAULT_PALETTE_METHOD))]
+        start = time.perf_counter()
+        with instrumentation.span("sweep_config", algorithm=params['algorithm_name']):
+            result = DitherAlgorithms.apply(params['algorithm_name'], image, palette, params['dither_strength'] / 100.0, precision=params.get('precision', "float64"), block_size=params.get('block_size', 1), **options)
+        return {'params': params, 'image': result, 'palette': palette, 'seconds': time.perf_counter() - start}
+
+    results = [None] * len(configs)
+    with ThreadPoolExecutor(max_workers=workers, initializer=reuse_work_buffers) as pool:
+        futures = [pool.submit(run, params) for params in configs]
+        for i, future in enumerate(futures):
+            results[i] = future.result()
+            if progress: progress(i + 1, len(configs), results[i])
+    return results
+
+def config_label(params: dict) -> str:
+    palette = params['palette_name'] + (f" {params['num_colors']}" if params['palette_name'] in DitherAlgorithms.DYNAMIC_PALETTES else "")
+    block = f" | {params['block_size']}px" if params.get('block_size', 1) > 1 else ""
+    return f"{params['algorithm_name']} | {palette} | {params['dither_strength']}%{block}"
+
+def contact_sheet(results: list, columns: int = None, cell_size: tuple = DEFAULT_CELL_SIZE) -> Image.Image:
+    # Grid of results, each scaled to fit its cell and captioned with its configuration and wall time.
+    columns = columns or max(1, int(len(results) ** 0.5 + 0.999))
+    rows = (len(results) + columns - 1) // columns; cell_width, cell_height = cell_size
+    sheet = Image.new('RGB', (columns * cell_width, rows * (cell_height + LABEL_HEIGHT)), (30, 30, 30))
+    draw = ImageDraw.Draw(sheet)
+    for i, result in enumerate(results):
+        x = (i % columns) * cell_width; y = (i // columns) * (cell_height + LABEL_HEIGHT)
+        tile = result['image'].convert('RGB'); scale = min(cell_width / tile.width, cell_height / tile.height)
+        tile = tile.resize((max(1, int(tile.width * scale)), max(1, int(tile.height * scale))), Image.NEAREST if scale >= 1 else Image.BOX)
+        sheet.paste(tile, (x + (cell_width - tile.width) // 2, y + (cell_height - tile.height) // 2))
+        draw.text((x + 4, y + cell_height + 2), config_label(result['params']), fill=(230, 230, 230))
+        draw.text((x + 4, y + cell_height + 14), f"{result['seconds'] * 1000:.0f} ms", fill=(150, 150, 150))
+    return sheet
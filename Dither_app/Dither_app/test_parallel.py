@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from PIL import Image
+from algorithms import DitherAlgorithms, new_control
+
+# The parallel kernels (row-parallel thresholds, wavefront error diffusion) must reproduce the serial kernels bit for
+# bit, and count every row of progress exactly once. The image is wider than several wavefront blocks and taller than
+# several progress bands so that block and band edges are crossed.
+PALETTES = {"PICO-8": DitherAlgorithms.PREDEFINED_PALETTES["PICO-8"], "Gray 4": DitherAlgorithms.build_palette(None, "Grayscale", 4)}
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:211, 0:293]
+    channels = [x * 255 / 292, y * 255 / 210, (x + y) * 255 / 503]
+    return Image.fromarray(np.clip(np.dstack(channels) + rng.normal(0, 32, (211, 293, 3)), 0, 255).astype(np.uint8))
+
+@pytest.mark.parametrize("palette_name", PALETTES)
+@pytest.mark.parametrize("algorithm", [name for name in DitherAlgorithms.ALGORITHMS if name != "Random"])
+def test_parallel_matches_serial(image, algorithm, palette_name):
+    palette = PALETTES[palette_name]
+    serial = DitherAlgorithms.apply(algorithm, image, palette, 1.0, parallel=False)
+    parallel = DitherAlgorithms.apply(algorithm, image, palette, 1.0, parallel=True)
+    assert np.array_equal(np.asarray(parallel.convert('RGB')), np.asarray(serial.convert('RGB')))
+
+@pytest.mark.parametrize("palette_name", PALETTES)
+@pytest.mark.parametrize("algorithm", ["Floyd-Steinberg", "Bayer (Ordered)", "Random"])
+def test_parallel_progress_counts_every_row(image, algorithm, palette_name):
+    control = new_control()
+    DitherAlgorithms.apply(algorithm, image, PALETTES[palette_name], 1.0, parallel=True, control=control)
+    assert control[1] == control[2] == image.height
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+from algorithms import DitherAlgorithms
+
+# Bounds the reduced-precision error-diffusion paths against the float64 reference. Both may move individual pixels but
+# must keep the mean color and the locally averaged (blurred) image close. Game Boy and CGA cannot reach the image's
+# whole gamut, so their carried error grows far past a pixel's range; with palettes that can, float32 is exact. Gray
+# palettes are left out: they take the single-channel kernel, which has no precision modes.
+DIFFUSION = ["Floyd-Steinberg", "Atkinson", "Jarvis, Judice, Ninke", "Stucki"]
+RGB_CUBE = [(r, g, b) for r in (0, 128, 255) for g in (0, 128, 255) for b in (0, 128, 255)]
+PALETTES = {**DitherAlgorithms.PREDEFINED_PALETTES, "RGB 27": RGB_CUBE}
+EXACT_FLOAT32_PALETTES = ["PICO-8", "RGB 27"]
+MEAN_TOLERANCE = 0.05
+BLURRED_MAE_TOLERANCE = 0.6
+
+@pytest.fixture(scope="module")
+def image():
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:300, 0:400]
+    channels = [x * 255 / 399, y * 255 / 299, (x + y) * 255 / 698]
+    noise = rng.normal(0, 24, (300, 400, 3))
+    return Image.fromarray(np.clip(np.dstack(channels) + noise, 0, 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(3))
+
+def rgb(result: Image.Image) -> np.ndarray:
+    return np.asarray(result.convert('RGB'), dtype=np.float64)
+
+def blurred(result: Image.Image) -> np.ndarray:
+    return np.asarray(result.convert('RGB').filter(ImageFilter.GaussianBlur(4)), dtype=np.float64)
+
+@pytest.mark.parametrize("palette_name", EXACT_FLOAT32_PALETTES)
+@pytest.mark.parametrize("strength", [1.0, 0.5])
+@pytest.mark.parametrize("algorithm", DIFFUSION)
+def test_float32_matches_float64(image, algorithm, strength, palette_name):
+    palette = PALETTES[palette_name]
+    reference = DitherAlgorithms.apply(algorithm, image, palette, strength, precision="float64")
+    result = DitherAlgorithms.apply(algorithm, image, palette, strength, precision="float32")
+    assert np.array_equal(rgb(result), rgb(reference))
+
+@pytest.mark.parametrize("palette_name", PALETTES)
+@pytest.mark.parametrize("precision", ["float32", "fixed"])
+@pytest.mark.parametrize("strength", [1.0, 0.5])
+@pytest.mark.parametrize("algorithm", DIFFUSION)
+def test_stays_close_to_float64(image, algorithm, strength, precision, palette_name):
+    palette = PALETTES[palette_name]
+    reference = DitherAlgorithms.apply(algorithm, image, palette, strength, precision="float64")
+    result = DitherAlgorithms.apply(algorithm, image, palette, strength, precision=precision)
+    assert np.abs(rgb(result).mean(axis=(0, 1)) - rgb(reference).mean(axis=(0, 1))).max() < MEAN_TOLERANCE
+    assert np.abs(blurred(result) - blurred(reference)).mean() < BLURRED_MAE_TOLERANCE
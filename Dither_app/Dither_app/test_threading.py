@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+
+# Numba's threading layer must already be running on the main thread when kernels first run on a background thread,
+# as the GUI warm-up and the ImageProcessor workers do; otherwise the interpreter hangs at exit.
+EXIT_TIMEOUT = 60
+
+@pytest.mark.parametrize("call", ["numba.get_num_threads()", "DitherAlgorithms.apply('Stucki', image, DitherAlgorithms.build_palette(image, 'Auto (From Image)', 8), 1.0, parallel=True)"])
+def test_background_thread_kernels_let_process_exit(call):
+    script = textwrap.dedent(f"""
+        import threading
+        import numba
+        import numpy as np
+        from PIL import Image
+        from algorithms import DitherAlgorithms
+        image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (64, 96, 3), dtype=np.uint8))
+        thread = threading.Thread(target=lambda: {call}, daemon=True); thread.start(); thread.join()
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)), timeout=EXIT_TIMEOUT, capture_output=True)
+    assert result.returncode == 0, result.stderr.decode()
@@ -6,6 +6,8 @@ class ImageUtils:
     
     @staticmethod
     def apply_lut(image: Image.Image, lut_name: str) -> Image.Image:
+        if image.mode == "P":
+            return ImageUtils.recolor_palette(image, ImageUtils.apply_lut(ImageUtils.palette_strip(image), lut_name))
         if lut_name == "Sepia":
             sepia_matrix = (
                 0.393, 0.769, 0.189, 0,
@@ -26,4 +28,16 @@ class ImageUtils:
         if not lut_data:
             return image
             
-        return image.point(lut_data)
\ No newline at end of file
+        return image.point(lut_data)
+
+    @staticmethod
+    def palette_strip(image: Image.Image) -> Image.Image:
+        # The palette of a "P" image as a 1-pixel-high RGB image, so per-pixel operations can run on the palette alone.
+        palette = image.getpalette()
+        return Image.frombytes("RGB", (len(palette) // 3, 1), bytes(palette))
+
+    @staticmethod
+    def recolor_palette(image: Image.Image, palette_strip: Image.Image) -> Image.Image:
+        recolored = image.copy()
+        recolored.putpalette(palette_strip.convert("RGB").tobytes())
+        return recolored
@@ -1,45 +1,174 @@
+import threading
 import traceback
-import numpy as np
-from PySide6.QtCore import QObject, Signal, Slot
+from PySide6.QtCore import QObject, Signal
 from PIL import Image
-from algorithms import DitherAlgorithms
+from algorithms import DIFFUSION_TAPS, DitherAlgorithms, DitherCancelled, new_control
+from palette import DEFAULT_PALETTE_METHOD
+import instrumentation
+from cache import ResultCache, shared_cache
 
-class ImageProcessor(QObject):
-    finished = Signal(Image.Image, list)
-    error = Signal(str)
+PREVIEW_MIN_SCALE = 2
 
-    def __init__(self, pil_image, dither_params):
-        super().__init__()
+class DitherJob:
+    def __init__(self, job_id, view, pil_image, dither_params):
+        self.job_id = job_id
+        self.view = view
         self.pil_image = pil_image
+        self.work_image = pil_image
         self.dither_params = dither_params
+        self.control = new_control()
+
+    def cancel(self):
+        self.control[0] = 1
+
+    def progress(self):
+        return min(1.0, self.control[1] / self.control[2]) if self.control[2] else 0.0
+
+class ImageProcessor(QObject):
+    # Persistent worker threads fed from a queue that keeps only the newest job per view. Submitting a job cancels
+    # the view's running job through the control array the kernels poll once per row.
+    preview = Signal(str, int, Image.Image)
+    finished = Signal(str, int, Image.Image, list)
+    error = Signal(str, int, str)
+    cancelled = Signal(str, int)
+
+    def __init__(self, num_workers=1):
+        super().__init__()
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._running = []
+        self._next_job_id = 0
+        self._stopping = False
+        self._traces = {}
+        self._blends = {}
+        self._threads = [threading.Thread(target=self._worker_loop, name=f"dither-worker-{i}", daemon=True) for i in range(num_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, view, pil_image, dither_params):
+        with self._condition:
+            self._next_job_id += 1
+            job = DitherJob(self._next_job_id, view, pil_image, dither_params)
+            superseded = self._pending.pop(view, None)
+            for running in self._running:
+                if running.view == view: running.cancel()
+            self._pending[view] = job
+            self._condition.notify()
+        if superseded:
+            self.cancelled.emit(view, superseded.job_id)
+        return job.job_id
+
+    def cancel(self, view):
+        with self._condition:
+            superseded = self._pending.pop(view, None)
+            for running in self._running:
+                if running.view == view: running.cancel()
+        if superseded:
+            self.cancelled.emit(view, superseded.job_id)
+
+    def progress(self, view):
+        with self._condition:
+            jobs = [job for job in self._running if job.view == view]
+            return max(jobs, key=lambda job: job.job_id).progress() if jobs else None
+
+    def last_trace(self, view):
+        # Root span of the view's most recently finished job while instrumentation is enabled, else None.
+        with self._condition:
+            return self._traces.get(view)
+
+    def shutdown(self, timeout=3.0):
+        with self._condition:
+            self._stopping = True
+            self._pending.clear()
+            for running in self._running: running.cancel()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                view = next(iter(self._pending))
+                job = self._pending.pop(view)
+                self._running.append(job)
+            try:
+                with instrumentation.span("job", view=job.view, job_id=job.job_id) as job_span:
+                    processed_image, palette_rgb = self._process(job)
+                if instrumentation.enabled():
+                    with self._condition: self._traces[job.view] = job_span
+                self.finished.emit(job.view, job.job_id, processed_image, palette_rgb)
+            except DitherCancelled:
+                self.cancelled.emit(job.view, job.job_id)
+            except Exception:
+                self.error.emit(job.view, job.job_id, traceback.format_exc())
+            finally:
+                with self._condition:
+                    self._running.remove(job)
+
+    def _emit_preview(self, job, palette_rgb, strength_float):
+        preview_width, preview_height = job.dither_params.get('preview_size') or (0, 0)
+        width, height = job.work_image.size
+        scale = min(preview_width / width, preview_height / height) if preview_width and preview_height else 1.0
+        if scale * PREVIEW_MIN_SCALE > 1.0:
+            return
+        with instrumentation.span("preview"):
+            proxy = job.work_image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BOX, reducing_gap=2.0)
+            preview_image = DitherAlgorithms.apply(job.dither_params['algorithm_name'], proxy, palette_rgb, strength_float, control=job.control)
+        self.preview.emit(job.view, job.job_id, preview_image)
+
+    @staticmethod
+    def _blend_key(params):
+        # Everything but strength; results of the same image under these parameters differ only in the final blend.
+        if not params.get('image_digest'): return None
+        return (params['image_digest'], params['algorithm_name'], params['palette_name'], params['num_colors'], params.get('palette_method', DEFAULT_PALETTE_METHOD), params.get('block_size') or 1)
+
+    def can_blend(self, view, dither_params):
+        # True when the view's last full-strength error diffusion matches these parameters, so only the blend remains.
+        with self._condition:
+            entry = self._blends.get(view)
+            return entry is not None and entry[0] == self._blend_key(dither_params)
+
+    def _blend(self, job, palette_rgb, strength_float):
+        # The view keeps one StrengthBlend: reused when only strength changed, otherwise replaced by a fresh diffusion
+        # run (after the low-resolution preview) for error-diffusion algorithms; None for the others. Also says whether
+        # the view's blend was reused.
+        key = self._blend_key(job.dither_params)
+        with self._condition: entry = self._blends.get(job.view)
+        if key and entry and entry[0] == key: return entry[1], True
+        if not key or DitherAlgorithms.ALGORITHMS[job.dither_params['algorithm_name']] not in DIFFUSION_TAPS: return None, False
+        self._emit_preview(job, palette_rgb, strength_float)
+        if strength_float < 1.0: DitherAlgorithms._begin(job.control, job.work_image.height)
+        blend = DitherAlgorithms.strength_blend(job.dither_params['algorithm_name'], job.work_image, palette_rgb, control=job.control)
+        with self._condition: self._blends[job.view] = (key, blend)
+        if strength_float < 1.0: blend.quantize(job.control)
+        return blend, False
 
-    @Slot()
-    def run(self):
-        try:
-            params = self.dither_params
-            palette_name = params['palette_name']
-            num_colors = params['num_colors']
-            
-            if palette_name == "Auto (From Image)":
-                quant_img = self.pil_image.quantize(colors=num_colors)
-                palette_rgb = [quant_img.getpalette()[i:i+3] for i in range(0, len(quant_img.getpalette()), 3)]
-            elif palette_name == "Grayscale":
-                palette_rgb = [[int(i)]*3 for i in np.linspace(0, 255, num_colors)]
-            else:
-                palette_rgb = DitherAlgorithms.PREDEFINED_PALETTES[palette_name]
-            
-            strength_float = params['dither_strength'] / 100.0
-            algo = params['algorithm_name']
-
-            if algo == "Floyd-Steinberg": processed_image = DitherAlgorithms.floyd_steinberg(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Atkinson": processed_image = DitherAlgorithms.atkinson(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Jarvis, Judice, Ninke": processed_image = DitherAlgorithms.jnn(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Stucki": processed_image = DitherAlgorithms.stucki(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Bayer (Ordered)": processed_image = DitherAlgorithms.bayer(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Clustered Dot Halftone": processed_image = DitherAlgorithms.clustered_dot_halftone(self.pil_image, palette_rgb, strength_float)
-            elif algo == "Random": processed_image = DitherAlgorithms.random(self.pil_image, palette_rgb, strength_float)
-            else: raise NotImplementedError(f"Algorithm '{algo}' is not implemented.")
-
-            self.finished.emit(processed_image, palette_rgb)
-        except Exception:
-            self.error.emit(traceback.format_exc())
\ No newline at end of file
+    def _process(self, job):
+        params = job.dither_params
+        cache_key = ResultCache.make_key(params['image_digest'], params) if params.get('image_digest') else None
+        with instrumentation.span("cache_lookup"): cached = shared_cache().get(cache_key) if cache_key else None
+        instrumentation.count("cache_hits" if cached else "cache_misses")
+        if cached:
+            return cached
+        with instrumentation.span("palette", palette=params['palette_name']): palette_rgb = DitherAlgorithms.build_palette(job.pil_image, params['palette_name'], params['num_colors'], params.get('palette_method', DEFAULT_PALETTE_METHOD), params.get('image_digest'))
+        strength_float = params['dither_strength'] / 100.0
+        # Pixel-art mode dithers the block-averaged image; the palette above still comes from the full-resolution source.
+        block_size = params.get('block_size') or 1
+        job.work_image = DitherAlgorithms.downscale_blocks(job.pil_image, block_size)
+        blend, reused = self._blend(job, palette_rgb, strength_float)
+        if blend:
+            if strength_float < 1.0 and blend.quantized is None: DitherAlgorithms._begin(job.control, job.work_image.height); blend.quantize(job.control)
+            processed_image = blend.render(strength_float)
+        else:
+            self._emit_preview(job, palette_rgb, strength_float)
+            processed_image = DitherAlgorithms.apply(params['algorithm_name'], job.work_image, palette_rgb, strength_float, control=job.control)
+        processed_image = DitherAlgorithms.upscale_blocks(processed_image, block_size, job.pil_image.size)
+        # Re-blends of the view's stored StrengthBlend stay out of the shared cache: each slider tick would otherwise
+        # store a full-size render and evict the A/B results the cache is there to keep, and re-blending is cheap.
+        if cache_key and not reused:
+            with instrumentation.span("cache_store"): shared_cache().put(cache_key, processed_image, palette_rgb)
+        return processed_image, palette_rgb